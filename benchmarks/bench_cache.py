@@ -0,0 +1,31 @@
+'''CacheFor hit and miss costs'''
+from typing import List
+
+from genericapi.client.utils import cache_for
+from harness import benchmark, Options, Result, time_async
+
+OPERATIONS = 50000
+
+
+@benchmark('cache')
+async def bench_cache(options: Options) -> List[Result]:
+    @cache_for(60)
+    async def cached(key: int) -> int:
+        return key
+
+    class Service:
+        @cache_for(60)
+        async def cached(self, key: int) -> int:
+            return key
+
+    service = Service()
+    await cached(1)
+    await service.cached(1)
+    counter = iter(range(10 ** 9))
+    ops = options.ops(OPERATIONS)
+    return [
+        await time_async('cache.hit[function]', lambda: cached(1), ops, options.repeat),
+        await time_async('cache.hit[method]', lambda: service.cached(1), ops, options.repeat),
+        await time_async('cache.miss[function]', lambda: cached(next(counter)), ops, options.repeat),
+        await time_async('cache.no_cache[function]', lambda: cached(1, no_cache=True), ops, options.repeat),
+    ]
@@ -0,0 +1,55 @@
+'''RequestEngine concurrent GET throughput against a local aiohttp stand-in'''
+from typing import AsyncIterator, List
+from contextlib import asynccontextmanager
+import asyncio
+
+from aiohttp.web import Application, AppRunner, json_response, Request, SockSite
+
+from genericapi.client import Client, SessionConfig
+from genericapi.server.runner import create_socket
+from harness import benchmark, load, Options, Result
+
+CONCURRENCY = 64
+REQUESTS = 5000
+
+
+@asynccontextmanager
+async def upstream() -> AsyncIterator[str]:
+    '''Serves a plain aiohttp app on a loopback port, yields its base url'''
+    async def item(request: Request):
+        # A little latency so identical concurrent requests overlap
+        await asyncio.sleep(.001)
+        return json_response({'id': request.match_info['id'], 'items': list(range(50))})
+
+    app = Application()
+    app.router.add_get('/items/{id}', item)
+    sock = create_socket('127.0.0.1', 0, reuse_port=False)
+    runner = AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    await SockSite(runner, sock).start()
+    try:
+        yield 'http://127.0.0.1:%d' % sock.getsockname()[1]
+    finally:
+        await runner.cleanup()
+
+
+@benchmark('client')
+async def bench_client(options: Options) -> List[Result]:
+    results = []
+    configs = {
+        'default': SessionConfig(),
+        'single_flight': SessionConfig(single_flight=True),
+    }
+    async with upstream() as baseurl:
+        for name, config in configs.items():
+            async with Client(baseurl, config=config) as client:
+                for paths in ('distinct', 'identical'):
+                    counter = iter(range(10 ** 9))
+
+                    async def _get() -> None:
+                        path = '/items/1' if paths == 'identical' else f'/items/{next(counter)}'
+                        async with client.get(path) as res:
+                            await res.read()
+                    results.append(await load(f'client.get[{name},{paths}]', _get, options.ops(REQUESTS),
+                                              concurrency=CONCURRENCY, repeat=options.repeat))
+    return results
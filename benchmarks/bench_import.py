@@ -0,0 +1,12 @@
+'''Cold import time of genericapi entry points (on top of aiohttp)'''
+from typing import List
+
+from harness import benchmark, Options, Result
+from import_budget import measure
+
+
+@benchmark('import')
+async def bench_import(options: Options) -> List[Result]:
+    # Reported as imports per second so that, like everywhere else, higher is better
+    return [Result(f'import[{module}]', 1, elapsed / 1000, p50_ms=elapsed, extra=dict(eager=eager))
+            for module, (elapsed, eager) in measure().items()]
@@ -0,0 +1,32 @@
+'''HTTPOk serialization across JSON codecs and payload sizes'''
+from typing import Any, Dict, List
+
+from genericapi.json import available_codecs, get_codec, set_default_codec
+from genericapi.exceptions.http import HTTPOk
+from harness import benchmark, Options, Result, time_sync
+
+OPERATIONS = {'small': 20000, 'medium': 2000, 'large': 20}
+
+
+def payload(size: str) -> Dict[str, Any]:
+    item = {'id': 1, 'name': 'benchmark item', 'tags': ['a', 'b', 'c'], 'score': 1.5, 'active': True}
+    count = {'small': 1, 'medium': 100, 'large': 10000}[size]
+    return {'status': 'ok', 'items': [dict(item, id=i) for i in range(count)]}
+
+
+@benchmark('json')
+async def bench_json(options: Options) -> List[Result]:
+    results = []
+    default = get_codec().name
+    try:
+        for name in available_codecs():
+            set_default_codec(name)
+            for size, ops in OPERATIONS.items():
+                body = payload(size)
+                result = time_sync(f'json.HTTPOk[{name},{size}]', lambda: HTTPOk(body),
+                                   options.ops(ops), options.repeat)
+                result.extra['bytes'] = len(get_codec().dumps(body))
+                results.append(result)
+    finally:
+        set_default_codec(default)
+    return results
@@ -0,0 +1,120 @@
+'''
+Connection lifecycle costs over loopback: HTTP/1.1 pipelining on keep-alive
+connections vs a connection per request, and the cost of access logging
+Requests are written on raw sockets so client overhead doesn't hide server costs
+'''
+from typing import AsyncIterator, List, Tuple
+from contextlib import asynccontextmanager
+import logging
+import asyncio
+import os
+
+from aiohttp.web import Request, Response, SockSite
+
+from genericapi.server import API
+from genericapi.server.runner import create_socket, make_runner, RunnerConfig
+from harness import benchmark, load, Options, Result
+
+CONNECTIONS = 8
+DEPTH = 16
+REQUESTS = 20000
+REQUEST = b'GET /ping HTTP/1.1\r\nHost: bench\r\n\r\n'
+CLOSING_REQUEST = b'GET /ping HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n'
+
+
+class PingAPI(API):
+    def setup_routes(self) -> None:
+        async def ping(request: Request) -> Response:
+            return Response(text='pong')
+        self.route_manager.add_route(method='GET', path='/ping', handler=ping, no_cors=True)
+
+
+@asynccontextmanager
+async def serving(config: RunnerConfig) -> AsyncIterator[Tuple[str, int]]:
+    '''Serves PingAPI with config on a loopback port, yields its address'''
+    app = PingAPI(settings=dict(environment='benchmark', log_level='CRITICAL'))
+    await app.open()
+    sock = create_socket('127.0.0.1', 0, reuse_port=False, backlog=config.backlog)
+    runner = make_runner(app, config)
+    await runner.setup()
+    await SockSite(runner, sock, backlog=config.backlog).start()
+    try:
+        yield sock.getsockname()[:2]
+    finally:
+        await runner.cleanup()
+        await app.close()
+
+
+@asynccontextmanager
+async def access_log_to_devnull() -> AsyncIterator[None]:
+    '''Makes access log lines get formatted and written (to /dev/null) like in production'''
+    logger = logging.getLogger('aiohttp.access')
+    level, propagate = logger.level, logger.propagate
+    with open(os.devnull, 'w') as devnull:
+        handler = logging.StreamHandler(devnull)
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        try:
+            yield
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+            logger.propagate = propagate
+
+
+async def read_response(reader: asyncio.StreamReader) -> None:
+    head = await reader.readuntil(b'\r\n\r\n')
+    for line in head.split(b'\r\n'):
+        if line[:15].lower() == b'content-length:':
+            await reader.readexactly(int(line[15:]))
+            return
+
+
+async def pipelined(name: str, address: Tuple[str, int], depth: int, options: Options) -> Result:
+    '''Each operation writes depth requests at once on a keep-alive connection and reads the responses'''
+    connections: asyncio.Queue = asyncio.Queue()
+    for _ in range(CONNECTIONS):
+        connections.put_nowait(await asyncio.open_connection(*address))
+    batch = REQUEST * depth
+
+    async def _batch() -> None:
+        reader, writer = await connections.get()
+        writer.write(batch)
+        for _ in range(depth):
+            await read_response(reader)
+        connections.put_nowait((reader, writer))
+    try:
+        result = await load(name, _batch, max(1, options.ops(REQUESTS) // depth),
+                            concurrency=CONNECTIONS, repeat=options.repeat)
+    finally:
+        while not connections.empty():
+            connections.get_nowait()[1].close()
+    # Throughput in requests, latencies are of whole batches
+    result.ops *= depth
+    result.extra['depth'] = depth
+    return result
+
+
+async def connection_per_request(name: str, address: Tuple[str, int], options: Options) -> Result:
+    async def _request() -> None:
+        reader, writer = await asyncio.open_connection(*address)
+        writer.write(CLOSING_REQUEST)
+        await read_response(reader)
+        writer.close()
+    return await load(name, _request, options.ops(REQUESTS // 4), concurrency=CONNECTIONS, repeat=options.repeat)
+
+
+@benchmark('keepalive')
+async def bench_keepalive(options: Options) -> List[Result]:
+    results = []
+    async with serving(RunnerConfig(access_log=False)) as address:
+        for depth in (1, DEPTH):
+            results.append(await pipelined(f'keepalive.pipelined[depth={depth}]', address, depth, options))
+        results.append(await connection_per_request('keepalive.connection_per_request', address, options))
+    async with access_log_to_devnull():
+        for access_log, sample in (('on', 1.), ('sampled', .01)):
+            async with serving(RunnerConfig(access_log_sample=sample)) as address:
+                results.append(await pipelined(f'keepalive.pipelined[depth={DEPTH},access_log={access_log}]',
+                                               address, DEPTH, options))
+    return results
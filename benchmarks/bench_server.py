@@ -0,0 +1,85 @@
+'''API request throughput/latency over loopback'''
+from typing import AsyncIterator, List, Optional
+from contextlib import asynccontextmanager
+
+from aiohttp.web import AppRunner, Request, SockSite
+import aiohttp
+
+from genericapi.server import API
+from genericapi.server.runner import create_socket
+from genericapi.exceptions.serializable import SerializableException, with_exception_serializer
+from genericapi.exceptions.http import HTTPOk
+from harness import benchmark, load, Options, Result
+
+CONCURRENCY = 32
+REQUESTS = 5000
+PAYLOAD = {'id': 1, 'name': 'benchmark', 'tags': ['a', 'b', 'c'], 'score': 1.5}
+
+
+class BenchError(SerializableException):
+    _http_status = 400
+
+
+class BenchAPI(API):
+    '''API with a handful of trivial routes, CORS mode taken from settings'''
+    def setup_routes(self) -> None:
+        no_cors = self.config('bench_cors') == 'off'
+
+        async def ok(request: Request):
+            raise HTTPOk(PAYLOAD)
+
+        @with_exception_serializer
+        async def serialized(request: Request):
+            raise HTTPOk(PAYLOAD)
+
+        @with_exception_serializer
+        async def serialized_error(request: Request):
+            raise BenchError('benchmark error')
+
+        for path, handler in (('/ok', ok), ('/serialized', serialized), ('/serialized-error', serialized_error)):
+            self.route_manager.add_route(method='GET', path=path, handler=handler, no_cors=no_cors)
+
+
+@asynccontextmanager
+async def serving(cors: str) -> AsyncIterator[str]:
+    '''Serves BenchAPI on a loopback port, yields its base url'''
+    app = BenchAPI(settings=dict(environment='benchmark',
+                                 log_level='CRITICAL',
+                                 bench_cors=cors,
+                                 cors_precompiled=cors == 'precompiled'))
+    await app.open()
+    sock = create_socket('127.0.0.1', 0, reuse_port=False)
+    runner = AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    await SockSite(runner, sock).start()
+    try:
+        yield 'http://127.0.0.1:%d' % sock.getsockname()[1]
+    finally:
+        await runner.cleanup()
+        await app.close()
+
+
+async def run_load(session: aiohttp.ClientSession,
+                   name: str,
+                   url: str,
+                   options: Options,
+                   origin: Optional[str] = None) -> Result:
+    headers = {'Origin': origin} if origin else {}
+
+    async def _request() -> None:
+        async with session.get(url, headers=headers) as res:
+            await res.read()
+    return await load(name, _request, options.ops(REQUESTS), concurrency=CONCURRENCY, repeat=options.repeat)
+
+
+@benchmark('server')
+async def bench_server(options: Options) -> List[Result]:
+    results = []
+    for cors in ('off', 'aiohttp_cors', 'precompiled'):
+        async with serving(cors) as baseurl, \
+                aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONCURRENCY)) as session:
+            origin = None if cors == 'off' else 'http://bench.example'
+            for path in ('/ok', '/serialized', '/serialized-error'):
+                results.append(await run_load(session, f'server{path}[cors={cors}]',
+                                              baseurl + path, options, origin))
+    return results
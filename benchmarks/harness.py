@@ -0,0 +1,159 @@
+'''
+Benchmark registry, timing helpers and result (de)serialization
+Benchmarks are async functions registered with @benchmark, taking Options and
+returning a list of Results
+'''
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dataclasses import asdict, dataclass, field
+import statistics
+import platform
+import asyncio
+import time
+import json
+import gc
+
+import aiohttp
+
+BENCHMARKS: Dict[str, Callable[['Options'], Awaitable[List['Result']]]] = {}
+
+
+@dataclass
+class Options:
+    '''
+    Benchmark run options
+      scale   -- multiplier of the number of operations (quick runs use < 1)
+      repeat  -- number of measured rounds, the best one is reported
+    '''
+    scale: float = 1.
+    repeat: int = 3
+
+    def ops(self, count: int) -> int:
+        return max(1, int(count * self.scale))
+
+
+@dataclass
+class Result:
+    '''A single measurement -- higher ops_per_sec is better'''
+    name: str
+    ops: int
+    seconds: float
+    p50_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def ops_per_sec(self) -> float:
+        return self.ops / self.seconds if self.seconds else 0.
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(asdict(self), ops_per_sec=self.ops_per_sec)
+
+
+def benchmark(name: str):
+    '''Registers an async benchmark function under name'''
+    def _decorator(func: Callable[[Options], Awaitable[List[Result]]]):
+        BENCHMARKS[name] = func
+        return func
+    return _decorator
+
+
+def best_of(rounds: List[Result]) -> Result:
+    '''Picks the fastest round -- the least disturbed by the rest of the machine'''
+    return max(rounds, key=lambda result: result.ops_per_sec)
+
+
+def time_sync(name: str, func: Callable[[], Any], ops: int, repeat: int) -> Result:
+    '''Measures ops calls of func'''
+    rounds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(ops):
+            func()
+        rounds.append(Result(name, ops, time.perf_counter() - start))
+    return best_of(rounds)
+
+
+async def time_async(name: str, func: Callable[[], Awaitable[Any]], ops: int, repeat: int) -> Result:
+    '''Measures ops sequential awaits of func()'''
+    rounds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(ops):
+            await func()
+        rounds.append(Result(name, ops, time.perf_counter() - start))
+    return best_of(rounds)
+
+
+async def load(name: str,
+               func: Callable[[], Awaitable[Any]],
+               ops: int,
+               *,
+               concurrency: int,
+               repeat: int) -> Result:
+    '''Runs ops calls of func from concurrency workers, measuring throughput and latency'''
+    rounds = []
+    for _ in range(repeat):
+        latencies: List[float] = []
+        remaining = ops
+
+        async def _worker() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                await func()
+                latencies.append(time.perf_counter() - start)
+
+        gc.collect()
+        start = time.perf_counter()
+        await asyncio.gather(*[_worker() for _ in range(concurrency)])
+        seconds = time.perf_counter() - start
+        latencies.sort()
+        rounds.append(Result(name, ops, seconds,
+                             p50_ms=statistics.median(latencies) * 1000,
+                             p99_ms=latencies[int(len(latencies) * .99) - 1] * 1000,
+                             extra=dict(concurrency=concurrency)))
+    return best_of(rounds)
+
+
+def environment() -> Dict[str, Any]:
+    '''Describes the machine and versions results were measured with'''
+    return dict(python=platform.python_version(),
+                implementation=platform.python_implementation(),
+                platform=platform.platform(),
+                machine=platform.machine(),
+                aiohttp=aiohttp.__version__,
+                timestamp=time.strftime('%Y-%m-%dT%H:%M:%S%z'))
+
+
+def dump(results: List[Result], path: str) -> None:
+    with open(path, 'w') as file:
+        json.dump(dict(environment=environment(), results=[result.as_dict() for result in results]),
+                  file, indent=2)
+
+
+def load_results(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path) as file:
+        return {result['name']: result for result in json.load(file)['results']}
+
+
+def compare(results: List[Result], baseline: Dict[str, Dict[str, Any]], threshold: float) -> List[str]:
+    '''
+    Prints the change of every result against baseline,
+    returns names of results whose throughput dropped by more than threshold
+    '''
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None or not base['ops_per_sec']:
+            print(f'{result.name:<55} {"new":>10}')
+            continue
+        change = result.ops_per_sec / base['ops_per_sec'] - 1
+        flag = ''
+        if change < -threshold:
+            regressions.append(result.name)
+            flag = '  REGRESSION'
+        print(f'{result.name:<55} {change:>+10.1%}{flag}')
+    return regressions
@@ -0,0 +1,67 @@
+'''
+Import time budget of genericapi
+    python benchmarks/import_budget.py [--budget-ms 50]
+Imports every entry point in a fresh interpreter and fails (exit 1) if
+  - importing it takes more than budget-ms on top of importing aiohttp itself
+  - it eagerly imports a module that is meant to be loaded lazily
+'''
+from typing import Dict, List, Tuple
+import subprocess
+import argparse
+import json
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ('genericapi.server', 'genericapi.client')
+# Only loaded once the feature using them is set up
+LAZY_MODULES = ('aiohttp_swagger', 'aiohttp_cors', 'aiolog', 'yaml', 'jinja2',
+                'multiprocessing', 'concurrent.futures.process')
+BUDGET_MS = 30.
+ROUNDS = 5
+
+# aiohttp is imported first, so only genericapi and its other dependencies are timed
+PROBE = '''
+import json, sys, time
+import aiohttp.web
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps(dict(ms=elapsed * 1000, lazy=[name for name in {lazy!r} if name in sys.modules])))
+'''
+
+
+def probe(module: str) -> Tuple[float, List[str]]:
+    '''Returns best import time of module on top of aiohttp (in ms) and lazy modules it imported'''
+    best, eager = float('inf'), []
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    for _ in range(ROUNDS):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(module=module, lazy=LAZY_MODULES)],
+                                check=True, stdout=subprocess.PIPE, env=env).stdout
+        result = json.loads(output)
+        best, eager = min(best, result['ms']), result['lazy']
+    return best, eager
+
+
+def measure() -> Dict[str, Tuple[float, List[str]]]:
+    '''Returns {entry point: (import ms on top of aiohttp, eagerly imported lazy modules)}'''
+    return {module: probe(module) for module in ENTRY_POINTS}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='genericapi import time budget')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS,
+                        help=f'allowed import time on top of aiohttp (default {BUDGET_MS:g}ms)')
+    args = parser.parse_args()
+    failures = 0
+    for module, (elapsed, eager) in measure().items():
+        status = 'ok'
+        if elapsed > args.budget_ms or eager:
+            failures += 1
+            status = 'OVER BUDGET' if elapsed > args.budget_ms else 'EAGER IMPORTS'
+        print(f'{module:<25} {elapsed:>8.1f}ms  {status}{"  " + ", ".join(eager) if eager else ""}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+'''
+Runs the benchmark suite
+    python benchmarks/run.py [--only server,json] [--quick]
+                             [--output results.json]
+                             [--save-baseline baseline.json]
+                             [--compare baseline.json [--threshold 0.1]]
+Everything runs on loopback. Exits with 1 if --compare finds throughput regressions
+'''
+from typing import List
+import argparse
+import asyncio
+import logging
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing registers the benchmarks
+import bench_server  # noqa: F401 pylint: disable=unused-import,wrong-import-position
+import bench_json  # noqa: F401 pylint: disable=unused-import,wrong-import-position
+import bench_client  # noqa: F401 pylint: disable=unused-import,wrong-import-position
+import bench_cache  # noqa: F401 pylint: disable=unused-import,wrong-import-position
+import bench_keepalive  # noqa: F401 pylint: disable=unused-import,wrong-import-position
+import bench_import  # noqa: F401 pylint: disable=unused-import,wrong-import-position
+from harness import BENCHMARKS, compare, dump, load_results, Options, Result  # pylint: disable=wrong-import-position
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='genericapi benchmarks')
+    parser.add_argument('--only', help=f'comma separated benchmarks to run ({", ".join(BENCHMARKS)})')
+    parser.add_argument('--quick', action='store_true', help='run a tenth of the operations, once')
+    parser.add_argument('--output', help='write results as json to that file')
+    parser.add_argument('--save-baseline', help='write results as json baseline to that file')
+    parser.add_argument('--compare', help='compare results with a baseline file')
+    parser.add_argument('--threshold', type=float, default=.1,
+                        help='throughput drop reported as a regression (default 0.1)')
+    return parser.parse_args()
+
+
+async def run(names: List[str], options: Options) -> List[Result]:
+    results: List[Result] = []
+    for name in names:
+        for result in await BENCHMARKS[name](options):
+            latency = f'  p50 {result.p50_ms:.2f}ms' if result.p50_ms is not None else ''
+            latency += f'  p99 {result.p99_ms:.2f}ms' if result.p99_ms is not None else ''
+            print(f'{result.name:<55} {result.ops_per_sec:>12,.0f} ops/s{latency}', flush=True)
+            results.append(result)
+    return results
+
+
+def main() -> int:
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        print(f'unknown benchmarks: {", ".join(sorted(unknown))}', file=sys.stderr)
+        return 2
+    options = Options(scale=.1, repeat=1) if args.quick else Options()
+    results = asyncio.run(run(names, options))
+    for path in (args.output, args.save_baseline):
+        if path:
+            dump(results, path)
+    if args.compare:
+        print(f'\nCompared with {args.compare}:')
+        regressions = compare(results, load_results(args.compare), args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) beyond {args.threshold:.0%}', file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
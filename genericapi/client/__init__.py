@@ -1 +1,2 @@
 from .client import Client
+from .config import SessionConfig
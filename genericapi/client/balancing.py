@@ -0,0 +1,196 @@
+'''
+Client side load balancing over a set of upstream endpoints
+Endpoints come from a resolver (static list, file, DNS SRV) refreshed
+periodically. Requests go to the endpoint with the least outstanding requests
+(or the better of two random ones) and endpoints failing repeatedly are
+ejected for a while
+'''
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional
+from dataclasses import dataclass
+import logging
+import asyncio
+import random
+import time
+import os
+
+from .resilience import HostState
+
+try:
+    import aiodns
+except ModuleNotFoundError:
+    aiodns = None
+
+log = logging.getLogger(__name__)
+
+LEAST_OUTSTANDING = 'least_outstanding'
+POWER_OF_TWO = 'p2c'
+
+
+class Resolver:
+    '''Source of upstream endpoint base urls'''
+    async def resolve(self) -> List[str]:
+        raise NotImplementedError()
+
+
+class StaticResolver(Resolver):
+    '''A fixed list of endpoints'''
+    def __init__(self, urls: Iterable[str]) -> None:
+        self.urls = [url.rstrip('/') for url in urls]
+
+    async def resolve(self) -> List[str]:
+        return self.urls
+
+
+class FileResolver(Resolver):
+    '''Endpoints listed one per line in a file (# starts a comment), re-read when it changes'''
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._mtime: Optional[float] = None
+        self._urls: List[str] = []
+
+    def _read(self) -> List[str]:
+        mtime = os.stat(self.path).st_mtime
+        if mtime != self._mtime:
+            with open(self.path) as file:
+                lines = (line.split('#', 1)[0].strip() for line in file)
+                self._urls = [line.rstrip('/') for line in lines if line]
+            self._mtime = mtime
+        return self._urls
+
+    async def resolve(self) -> List[str]:
+        return await asyncio.get_event_loop().run_in_executor(None, self._read)
+
+
+class DNSSRVResolver(Resolver):
+    '''
+    Endpoints of the highest priority (lowest value) SRV records of name
+    Requires aiodns
+    '''
+    def __init__(self, name: str, *, scheme: str = 'http') -> None:
+        if aiodns is None:
+            raise RuntimeError('DNSSRVResolver requires aiodns to be installed')
+        self.name = name
+        self.scheme = scheme
+        self._dns: Optional['aiodns.DNSResolver'] = None
+
+    async def resolve(self) -> List[str]:
+        if self._dns is None:
+            self._dns = aiodns.DNSResolver()
+        records = await self._dns.query(self.name, 'SRV')
+        if not records:
+            return []
+        priority = min(record.priority for record in records)
+        return [f'{self.scheme}://{record.host.rstrip(".")}:{record.port}'
+                for record in records if record.priority == priority]
+
+
+@dataclass
+class BalancerConfig:
+    '''
+    Load balancing settings
+      strategy         -- 'least_outstanding' or 'p2c' (power of two random choices)
+      refresh_interval -- seconds between endpoint resolutions
+      eject_after      -- consecutive failures (connection errors, timeouts, 5xx) ejecting an endpoint
+      eject_for        -- seconds an endpoint stays ejected
+    '''
+    strategy: str = POWER_OF_TWO
+    refresh_interval: float = 30.
+    eject_after: int = 5
+    eject_for: float = 30.
+
+
+class Endpoint:
+    '''An upstream endpoint and its load/health'''
+    __slots__ = ('url', 'outstanding', 'failures', 'ejected_until')
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.
+
+    def __repr__(self) -> str:
+        return f'Endpoint({self.url!r}, outstanding={self.outstanding}, failures={self.failures})'
+
+
+class LoadBalancer:
+    '''Picks endpoints for RequestEngine, keeping them resolved and tracking their health'''
+    def __init__(self, resolver: Resolver, config: Optional[BalancerConfig] = None) -> None:
+        self.resolver = resolver
+        self.config = config or BalancerConfig()
+        if self.config.strategy not in (LEAST_OUTSTANDING, POWER_OF_TWO):
+            raise ValueError(f'unknown balancing strategy {self.config.strategy!r}')
+        self.endpoints: List[Endpoint] = []
+        # Latency of all endpoints together, used for hedging
+        self.state = HostState('balanced', None)
+        self._refresh: Optional[asyncio.Task] = None
+        self._resolved = False
+
+    async def start(self) -> None:
+        '''Resolves endpoints and keeps refreshing them in the background'''
+        await self.refresh()
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._keep_refreshing())
+
+    async def stop(self) -> None:
+        if self._refresh is not None:
+            self._refresh.cancel()
+            try:
+                await self._refresh
+            except asyncio.CancelledError:
+                pass
+            self._refresh = None
+
+    async def refresh(self) -> None:
+        '''Resolves endpoints, keeping the state of the ones that are still there'''
+        urls = await self.resolver.resolve()
+        if not urls and self.endpoints:
+            log.warning('Resolver returned no endpoints -- keeping %d known ones', len(self.endpoints))
+            return
+        known: Dict[str, Endpoint] = {endpoint.url: endpoint for endpoint in self.endpoints}
+        self.endpoints = [known.get(url) or Endpoint(url) for url in dict.fromkeys(urls)]
+        self._resolved = True
+
+    async def _keep_refreshing(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Refreshing endpoints failed -- keeping %d known ones', len(self.endpoints))
+
+    async def pick(self) -> Endpoint:
+        '''Returns the endpoint to send the next request to'''
+        if not self._resolved:
+            await self.refresh()
+        if not self.endpoints:
+            raise RuntimeError('no upstream endpoints resolved')
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.ejected_until <= now]
+        if not candidates:
+            # Everything is ejected -- better to try them all than to fail everything
+            candidates = self.endpoints
+        if self.config.strategy == LEAST_OUTSTANDING or len(candidates) < 3:
+            least = min(endpoint.outstanding for endpoint in candidates)
+            return random.choice([endpoint for endpoint in candidates if endpoint.outstanding == least])
+        first, second = random.sample(candidates, 2)
+        return first if first.outstanding <= second.outstanding else second
+
+    @staticmethod
+    def started(endpoint: Endpoint) -> None:
+        endpoint.outstanding += 1
+
+    def finished(self, endpoint: Endpoint, success: Optional[bool]) -> None:
+        '''Records the end of a request to endpoint, success is None for cancelled ones'''
+        endpoint.outstanding -= 1
+        if success is None:
+            return
+        if success:
+            endpoint.failures = 0
+            return
+        endpoint.failures += 1
+        if endpoint.failures >= self.config.eject_after and endpoint.ejected_until <= time.monotonic():
+            log.warning('Ejecting %s for %.0fs after %d failures',
+                        endpoint.url, self.config.eject_for, endpoint.failures)
+            endpoint.ejected_until = time.monotonic() + self.config.eject_for
+            endpoint.failures = 0
@@ -0,0 +1,130 @@
+'''Concurrency-limited and rate-limited bulk request issuance'''
+from __future__ import annotations
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, Iterable,
+                    List, Optional, Tuple, TYPE_CHECKING, Union)
+from dataclasses import dataclass, field
+import asyncio
+
+from aiohttp import ClientResponse
+
+from ..json import get_codec
+
+if TYPE_CHECKING:
+    from .engine import RequestEngine
+
+ResponseHandler = Callable[[ClientResponse], Awaitable[Any]]
+RawRequestSpec = Union['RequestSpec', Tuple[str, str], Tuple[str, str, Dict[str, Any]]]
+DEFAULT_CONCURRENCY = 10
+_DONE = object()
+
+
+@dataclass
+class RequestSpec:
+    '''Describes a single request of a batch (kwargs are passed to RequestEngine.issue)'''
+    method: str
+    path: str
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def of(cls, spec: RawRequestSpec) -> RequestSpec:
+        '''Accepts a RequestSpec or a (method, path[, kwargs]) tuple'''
+        if isinstance(spec, cls):
+            return spec
+        return cls(*spec)
+
+
+@dataclass
+class RequestResult:
+    '''
+    Outcome of a single request of a batch
+    index is the position of the request in the input iterable
+    '''
+    index: int
+    spec: RequestSpec
+    value: Any = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class RateLimiter:
+    '''Spaces out acquisitions so that at most rate of them happen per second'''
+    __slots__ = ('_interval', '_next')
+    def __init__(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError('rate has to be positive')
+        self._interval = 1. / rate
+        self._next = 0.
+
+    async def acquire(self) -> None:
+        now = asyncio.get_event_loop().time()
+        wait = self._next - now
+        self._next = max(now, self._next) + self._interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+async def read_json(res: ClientResponse) -> Any:
+    '''Default batch response handler -- raises on error statuses and returns parsed json'''
+    res.raise_for_status()
+    return await res.json(loads=get_codec().loads)
+
+
+async def gather_requests(engine: RequestEngine,
+                          specs: Iterable[RawRequestSpec],
+                          *,
+                          concurrency: int = DEFAULT_CONCURRENCY,
+                          rate: Optional[float] = None,
+                          handler: ResponseHandler = read_json) -> AsyncIterator[RequestResult]:
+    '''
+    Issues requests described by specs with at most concurrency of them in flight
+    and at most rate of them started per second
+    Yields RequestResult in completion order; a failing request (including handler errors)
+    is reported in its result and doesn't affect the rest of the batch.
+    specs are consumed lazily, so it may be a generator of any length
+    '''
+    if concurrency < 1:
+        raise ValueError('concurrency has to be at least 1')
+    pending = enumerate(specs)
+    limiter = RateLimiter(rate) if rate else None
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    failures: List[Exception] = []
+
+    async def _worker() -> None:
+        try:
+            for index, raw_spec in pending:
+                spec = RequestSpec.of(raw_spec)
+                if limiter is not None:
+                    await limiter.acquire()
+                try:
+                    async with engine.issue(spec.method, spec.path, **spec.kwargs) as res:
+                        result = RequestResult(index, spec, value=await handler(res))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:  # pylint: disable=broad-except
+                    result = RequestResult(index, spec, error=exc)
+                await results.put(result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # pylint: disable=broad-except
+            # Raised by the specs iterable itself -- surfaced once the batch is drained
+            failures.append(exc)
+        await results.put(_DONE)
+
+    workers = [asyncio.ensure_future(_worker()) for _ in range(concurrency)]
+    running = len(workers)
+    try:
+        while running:
+            result = await results.get()
+            if result is _DONE:
+                running -= 1
+                continue
+            yield result
+        if failures:
+            raise failures[0]
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,262 @@
+'''
+HTTP response caching for RequestEngine
+honoring Cache-Control/Expires freshness and ETag/Last-Modified revalidation
+'''
+from __future__ import annotations
+from typing import Any, Callable, Dict, Hashable, Mapping, Optional, Tuple
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+import hashlib
+import asyncio
+import pickle
+import json
+import time
+import os
+
+from multidict import CIMultiDict, CIMultiDictProxy
+from aiohttp import ClientResponse
+from yarl import URL
+
+from ..lru import LRUCache
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+CACHEABLE_STATUSES = frozenset({200, 203})
+# Rough per-entry overhead accounted for on top of body size
+ENTRY_OVERHEAD = 512
+# Headers of a 304 response that update the stored entry
+REVALIDATION_HEADERS = ('Cache-Control', 'Expires', 'ETag', 'Last-Modified', 'Date', 'Age')
+
+
+def parse_cache_control(header: Optional[str]) -> Dict[str, Optional[str]]:
+    '''Parses Cache-Control header into a dictionary of lowercase directives'''
+    directives: Dict[str, Optional[str]] = {}
+    if not header:
+        return directives
+    for directive in header.split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') if value else None
+    return directives
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers: Mapping[str, str]) -> Optional[float]:
+    '''
+    Returns number of seconds a response stays fresh
+    or None if the response must not be stored at all
+    '''
+    directives = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0.
+    for directive in ('s-maxage', 'max-age'):
+        if directives.get(directive):
+            try:
+                return max(0., float(directives[directive] or 0) - float(headers.get('Age') or 0))
+            except ValueError:
+                return 0.
+    expires = _http_date(headers.get('Expires'))
+    if expires is not None:
+        date = _http_date(headers.get('Date')) or time.time()
+        return max(0., expires - date)
+    return 0.
+
+
+@dataclass(frozen=True)
+class CachedEntry:
+    '''A stored response'''
+    url: str
+    status: int
+    reason: Optional[str]
+    headers: Tuple[Tuple[str, str], ...]
+    body: bytes
+    expires_at: float
+
+    @classmethod
+    def from_response(cls, res: ClientResponse, body: bytes) -> Optional[CachedEntry]:
+        '''Creates an entry out of a fully read response or returns None if it's not cacheable'''
+        if res.status not in CACHEABLE_STATUSES:
+            return None
+        lifetime = freshness_lifetime(res.headers)
+        if lifetime is None:
+            return None
+        if not lifetime and 'ETag' not in res.headers and 'Last-Modified' not in res.headers:
+            # Can be neither served nor revalidated
+            return None
+        return cls(url=str(res.url),
+                   status=res.status,
+                   reason=res.reason,
+                   headers=tuple(res.headers.items()),
+                   body=body,
+                   expires_at=time.time() + lifetime)
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + ENTRY_OVERHEAD
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def validators(self) -> Dict[str, str]:
+        '''Returns conditional request headers for revalidating this entry'''
+        headers = CIMultiDict(self.headers)
+        conditional = {}
+        if 'ETag' in headers:
+            conditional['If-None-Match'] = headers['ETag']
+        if 'Last-Modified' in headers:
+            conditional['If-Modified-Since'] = headers['Last-Modified']
+        return conditional
+
+    def revalidated(self, not_modified: Mapping[str, str]) -> Optional[CachedEntry]:
+        '''Returns a copy of the entry refreshed with headers of a 304 response'''
+        headers = CIMultiDict(self.headers)
+        for name in REVALIDATION_HEADERS:
+            if name in not_modified:
+                headers[name] = not_modified[name]
+        lifetime = freshness_lifetime(headers)
+        if lifetime is None:
+            return None
+        return replace(self, headers=tuple(headers.items()), expires_at=time.time() + lifetime)
+
+
+class CachedResponse:
+    '''
+    Response served from the cache
+    Mirrors the reading API of aiohttp.ClientResponse
+    '''
+    __slots__ = ('_entry', 'headers', 'url', 'method')
+    from_cache = True
+    def __init__(self, entry: CachedEntry, method: str = 'GET') -> None:
+        self._entry = entry
+        self.headers = CIMultiDictProxy(CIMultiDict(entry.headers))
+        self.url = URL(entry.url)
+        self.method = method
+
+    @property
+    def status(self) -> int:
+        return self._entry.status
+
+    @property
+    def reason(self) -> Optional[str]:
+        return self._entry.reason
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get('Content-Type', 'application/octet-stream').split(';')[0].strip()
+
+    @property
+    def charset(self) -> Optional[str]:
+        _, _, params = self.headers.get('Content-Type', '').partition(';')
+        name, _, value = params.strip().partition('=')
+        return value.strip('"') if name.lower() == 'charset' else None
+
+    @property
+    def body(self) -> bytes:
+        return self._entry.body
+
+    async def read(self) -> bytes:
+        return self._entry.body
+
+    async def text(self, encoding: Optional[str] = None, errors: str = 'strict') -> str:
+        return self._entry.body.decode(encoding or self.charset or 'utf-8', errors)
+
+    async def json(self,
+                   *,
+                   encoding: Optional[str] = None,
+                   loads: Callable[[str], Any] = json.loads,
+                   content_type: Optional[str] = 'application/json') -> Any:
+        if not self._entry.body.strip():
+            return None
+        return loads(await self.text(encoding))
+
+    def raise_for_status(self) -> None:
+        '''Only successful responses are cached'''
+
+    def release(self) -> None:
+        pass
+
+
+class ResponseCache:
+    '''Response cache backend interface'''
+    async def get(self, key: Hashable) -> Optional[CachedEntry]:
+        raise NotImplementedError()
+
+    async def set(self, key: Hashable, entry: CachedEntry) -> None:
+        raise NotImplementedError()
+
+    async def delete(self, key: Hashable) -> None:
+        raise NotImplementedError()
+
+
+class MemoryResponseCache(ResponseCache):
+    '''In-memory response cache evicting least recently used entries above max_bytes'''
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_items: Optional[int] = None) -> None:
+        self._entries: LRUCache[Hashable, CachedEntry] = LRUCache(max_items,
+                                                                  max_bytes=max_bytes,
+                                                                  sizeof=lambda entry: entry.size)
+
+    async def get(self, key: Hashable) -> Optional[CachedEntry]:
+        return self._entries.get(key)
+
+    async def set(self, key: Hashable, entry: CachedEntry) -> None:
+        self._entries[key] = entry
+
+    async def delete(self, key: Hashable) -> None:
+        self._entries.pop(key)
+
+
+class DiskResponseCache(ResponseCache):
+    '''
+    On-disk response cache storing one pickled entry per file in directory
+    File access happens in the default executor so the event loop isn't blocked
+    '''
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: Hashable) -> str:
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def _read(self, key: Hashable) -> Optional[CachedEntry]:
+        try:
+            with open(self._path(key), 'rb') as file:
+                return pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _write(self, key: Hashable, entry: CachedEntry) -> None:
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _remove(self, key: Hashable) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def get(self, key: Hashable) -> Optional[CachedEntry]:
+        return await asyncio.get_event_loop().run_in_executor(None, self._read, key)
+
+    async def set(self, key: Hashable, entry: CachedEntry) -> None:
+        await asyncio.get_event_loop().run_in_executor(None, self._write, key, entry)
+
+    async def delete(self, key: Hashable) -> None:
+        await asyncio.get_event_loop().run_in_executor(None, self._remove, key)
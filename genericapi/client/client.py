@@ -1,17 +1,59 @@
 from __future__ import annotations
-from typing import Optional
+from typing import Any, AsyncIterator, Iterable, Optional, Union
 import logging
 
+from .batch import (gather_requests, read_json, DEFAULT_CONCURRENCY, RawRequestSpec,
+                    RequestResult, RequestSpec, ResponseHandler)
+from .balancing import Resolver, StaticResolver
+from .config import SessionConfig
 from .engine import RequestEngine
 
 log = logging.getLogger(__name__)
 
 
 class Client(RequestEngine):
-    __slots__ = RequestEngine.__slots__
+    '''
+    Client of a single host, or of several endpoints (a list of base urls or a Resolver)
+    requests are then balanced over according to config.balancing
+    '''
+    __slots__ = ()
     host: Optional[str] = None
-    def __init__(self, host: Optional[str] = None) -> None:
+    endpoints: Optional[Union[Iterable[str], Resolver]] = None
+    config: Optional[SessionConfig] = None
+    def __init__(self,
+                 host: Optional[str] = None,
+                 config: Optional[SessionConfig] = None,
+                 *,
+                 endpoints: Optional[Union[Iterable[str], Resolver]] = None) -> None:
         host = host or self.host
-        if not host:
+        endpoints = endpoints or self.endpoints
+        if not host and not endpoints:
             raise ValueError('no host specified')
-        super().__init__(host)
+        resolver = None
+        if endpoints:
+            resolver = endpoints if isinstance(endpoints, Resolver) else StaticResolver(endpoints)
+        super().__init__(host or '', config=config or self.config, resolver=resolver)
+
+    def gather_requests(self,
+                        specs: Iterable[RawRequestSpec],
+                        *,
+                        concurrency: int = DEFAULT_CONCURRENCY,
+                        rate: Optional[float] = None,
+                        handler: ResponseHandler = read_json) -> AsyncIterator[RequestResult]:
+        '''
+        Issues a batch of requests with bounded concurrency and optional rate (per second)
+        Yields RequestResult objects in completion order, see batch.gather_requests
+        '''
+        return gather_requests(self, specs, concurrency=concurrency, rate=rate, handler=handler)
+
+    def map(self,
+            method: str,
+            paths: Iterable[str],
+            *,
+            concurrency: int = DEFAULT_CONCURRENCY,
+            rate: Optional[float] = None,
+            handler: ResponseHandler = read_json,
+            **kw: Any) -> AsyncIterator[RequestResult]:
+        '''Issues the same kind of request (sharing kw) for each of the paths'''
+        specs = (RequestSpec(method, path, kw) for path in paths)
+        return self.gather_requests(specs, concurrency=concurrency, rate=rate, handler=handler)
@@ -1,11 +1,16 @@
 '''GenericClient session configuration'''
-from typing import Collection, Dict, Iterable, Union, Type
+from typing import Any, Collection, Dict, Iterable, Mapping, Optional, Union, Type
 from dataclasses import dataclass, field
+import asyncio
 
 from tenacity.stop import stop_base
 from tenacity.wait import wait_base
 import aiohttp
 
+from .cache import ResponseCache
+from .resilience import CircuitBreakerConfig
+from .balancing import BalancerConfig
+from .tracing import RequestTracer
 from . import defaults
 
 PolicyType = Union[stop_base, wait_base]
@@ -15,16 +20,64 @@ PolicyType = Union[stop_base, wait_base]
 class SessionConfig:
     '''
     Contains session configuration for Client
-    That includes retry specification, error throwing etc
+    That includes retry specification, error throwing,
+    connection pool limits etc
+    Only requests with a method in retry_methods are retried (on retry_codes
+    and retry_errors) and never ones with a streamed (non in-memory) data= body
+    With single_flight enabled concurrent identical GET/HEAD requests
+    share a single upstream call
+    With response_cache set GET responses are cached according to
+    their Cache-Control/ETag headers
+    With tracer set per host phase timings and retries are recorded
+    With circuit_breaker set requests to failing hosts fail fast with CircuitOpenError
+    With hedge enabled GET/HEAD requests slower than hedge_quantile of the host
+    latency get a second concurrent attempt, the first success wins
+    balancing configures load balancing of clients created with multiple endpoints
+    With structured_logging enabled the client starts the shared json LogPipeline
+    (genericapi.logs) instead of aiolog
     '''
     retry_codes: Collection[str] = field(default_factory=lambda: defaults.RETRY_CODES)
+    retry_methods: Collection[str] = field(default_factory=lambda: defaults.RETRY_METHODS)
     retry_errors: Iterable[Type[Exception]] = field(default_factory=tuple)
     retry_policy: Dict[str, PolicyType] = field(default_factory=lambda: defaults.RETRY_POLICY)
     timeout: int = defaults.TIMEOUT
     on_connerr: bool = True
     on_timeout: bool = False
+    limit: int = defaults.CONNECTION_LIMIT
+    limit_per_host: int = defaults.CONNECTION_LIMIT_PER_HOST
+    keepalive_timeout: float = defaults.KEEPALIVE_TIMEOUT
+    dns_cache_ttl: int = defaults.DNS_CACHE_TTL
+    single_flight: bool = False
+    response_cache: Optional[ResponseCache] = None
+    tracer: Optional[RequestTracer] = None
+    circuit_breaker: Optional[CircuitBreakerConfig] = None
+    hedge: bool = False
+    hedge_quantile: float = .95
+    balancing: Optional[BalancerConfig] = None
+    structured_logging: bool = False
     def __post_init__(self) -> None:
-        self.retry_codes = {str(retry_code) for retry_code in self.retry_codes}
+        self.retry_codes = {str(retry_code).lower() for retry_code in self.retry_codes}
+        self.retry_methods = {method.upper() for method in self.retry_methods}
+        new_errors = list(self.retry_errors)
         if self.on_connerr:
-            new_errors = list(self.retry_errors) + [aiohttp.client_exceptions.ClientConnectionError]
-            self.retry_errors = tuple(new_errors)
+            new_errors.append(aiohttp.client_exceptions.ClientConnectionError)
+        if self.on_timeout:
+            new_errors.append(asyncio.TimeoutError)
+        self.retry_errors = tuple(new_errors)
+
+    def should_retry(self, status: int) -> bool:
+        '''Checks if response status matches any of retry_codes (e.g. '503' or '5xx')'''
+        code = str(status)
+        return code in self.retry_codes or f'{code[0]}xx' in self.retry_codes
+
+    def can_retry(self, method: str, kw: Mapping[str, Any]) -> bool:
+        '''Checks if a request can be replayed: its method is in retry_methods and its body is in memory'''
+        data = kw.get('data')
+        return method in self.retry_methods and (data is None or isinstance(data, (bytes, bytearray, str, Mapping)))
+
+    def connector_kwargs(self) -> Dict[str, Any]:
+        '''Returns keyword arguments for aiohttp.TCPConnector'''
+        return {'limit': self.limit,
+                'limit_per_host': self.limit_per_host,
+                'keepalive_timeout': self.keepalive_timeout,
+                'ttl_dns_cache': self.dns_cache_ttl}
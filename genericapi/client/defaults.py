@@ -1,9 +1,15 @@
 '''Default values for Generic Client configuration'''
-from tenacity import wait_random_exponential, stop_after_delay
+from tenacity import wait_random_exponential, stop_after_attempt, stop_after_delay
 
 RETRY_CODES = {'5xx'}
+# Methods safe to replay -- POST/PATCH are only retried if the caller opts in
+RETRY_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
 TIMEOUT = 30
 RETRY_POLICY = {
     'wait': wait_random_exponential(multiplier=1, max=15),
-    'stop': stop_after_delay(30)
+    'stop': stop_after_attempt(3) | stop_after_delay(30)
 }
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 30
+KEEPALIVE_TIMEOUT = 30
+DNS_CACHE_TTL = 300
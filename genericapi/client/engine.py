@@ -1,25 +1,85 @@
 from __future__ import annotations
-from typing import AsyncContextManager, AsyncIterator
+from typing import AsyncContextManager, AsyncIterator, Awaitable, Callable, cast, Dict, Hashable, Optional, Tuple
 from contextlib import asynccontextmanager
+import itertools
 import asyncio
+import time
 
-from aiohttp import ClientSession, ClientResponse
-import aiolog
+from aiohttp import ClientSession, ClientResponse, ClientTimeout, TCPConnector
+from tenacity import AsyncRetrying, retry_if_exception_type
+from yarl import URL
+
+from ..singleflight import SingleFlight
+from ..logs import default_pipeline
+from .cache import CachedEntry, CachedResponse, ResponseCache
+from .resilience import CircuitOpenError, HostState
+from .balancing import Endpoint, LoadBalancer, Resolver
+from .signals import ShouldRetry, return_from_signal
+from .streaming import stream_to, StreamTarget
+from .config import SessionConfig
+
+COALESCABLE_METHODS = frozenset({'GET', 'HEAD'})
+COALESCABLE_KWARGS = frozenset({'params', 'headers'})
+BODY_KWARGS = frozenset({'data', 'json'})
 
 
 class RequestEngine:
-    '''RequestEngine takes care of all request issuance'''
-    __slots__ = ('_baseurl', '_sess')
-    def __init__(self, baseurl: str) -> None:
+    '''
+    RequestEngine takes care of all request issuance
+    Requests go to baseurl, or with a resolver, are balanced over
+    the endpoints it resolves (see client.balancing)
+    '''
+    __slots__ = ('_baseurl', '_sess', '_config', '_flights', '_hosts', '_balancer', '__weakref__')
+    def __init__(self,
+                 baseurl: str,
+                 config: Optional[SessionConfig] = None,
+                 *,
+                 resolver: Optional[Resolver] = None) -> None:
+        self._config = config or SessionConfig()
+        self._sess: Optional[ClientSession] = None
+        self._flights = SingleFlight()
+        self._hosts: Dict[str, HostState] = {}
+        self._balancer: Optional[LoadBalancer] = None
+        if resolver is not None:
+            # Paths are joined with the endpoint picked for each attempt
+            baseurl = ''
+            self._balancer = LoadBalancer(resolver, self._config.balancing)
         self._baseurl = baseurl
-        self._sess = ClientSession()
+
+    @property
+    def balancer(self) -> Optional[LoadBalancer]:
+        return self._balancer
+
+    @property
+    def session(self) -> ClientSession:
+        '''
+        Returns underlying aiohttp.ClientSession
+        creating it (with a pooled connector) on first use
+        '''
+        if self._sess is None or self._sess.closed:
+            tracer = self._config.tracer
+            self._sess = ClientSession(
+                connector=TCPConnector(**self._config.connector_kwargs()),
+                timeout=ClientTimeout(total=self._config.timeout),
+                trace_configs=[tracer.trace_config()] if tracer is not None else None
+            )
+        return self._sess
 
     async def __aenter__(self) -> RequestEngine:
         await self.open()
         return self
 
     async def open(self) -> None:
-        '''Opens aiohttp.ClientSession'''
+        '''
+        Starts asynchroneous logging (and endpoint resolution when balancing)
+        aiohttp.ClientSession is opened lazily on first request
+        '''
+        if self._balancer is not None:
+            await self._balancer.start()
+        if self._config.structured_logging:
+            default_pipeline().start()
+            return
+        import aiolog  # pylint: disable=import-outside-toplevel
         aiolog.start(loop=asyncio.get_event_loop())
 
     async def __aexit__(self, exc_type, exc, tb) -> None:
@@ -30,15 +90,241 @@ class RequestEngine:
         Close underlying aiohttp.ClientSession
         and asynchroneous logging
         '''
-        await self._sess.close()
+        if self._sess is not None:
+            await self._sess.close()
+        if self._balancer is not None:
+            await self._balancer.stop()
+        if self._config.structured_logging:
+            await default_pipeline().stop_async()
+            return
+        import aiolog  # pylint: disable=import-outside-toplevel
         await aiolog.stop()
 
+    def _host_state(self, url: str) -> HostState:
+        origin = str(URL(url).origin())
+        try:
+            return self._hosts[origin]
+        except KeyError:
+            state = self._hosts[origin] = HostState(origin, self._config.circuit_breaker)
+            return state
+
+    async def _target(self, url: str) -> Tuple[Optional[Endpoint], str]:
+        '''Returns the endpoint (when balancing) and the absolute url to send a request for url to'''
+        if self._balancer is None:
+            return None, url
+        endpoint = await self._balancer.pick()
+        return endpoint, endpoint.url + url
+
+    async def _attempt(self, method: str, url: str, *, retry: bool = False, **kw) -> ClientResponse:
+        '''
+        Issues a single request through the circuit breaker of its host, measuring latency
+        When balancing, the endpoint is picked here, so that every attempt may go elsewhere
+        Endpoint load is counted until the response headers arrive
+        Retries are traced under the host they are actually sent to
+        '''
+        endpoint, url = await self._target(url)
+        tracer = self._config.tracer
+        if retry and tracer is not None:
+            tracer.record_retry(URL(url).host or '')
+        state = self._host_state(url)
+        breaker = state.breaker
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f'circuit open for {state.origin}')
+        balancer = self._balancer
+        if endpoint is not None:
+            balancer.started(endpoint)  # type: ignore
+        start = time.perf_counter()
+        try:
+            res = await self.session.request(method, url, **kw)
+        except asyncio.CancelledError:
+            # Neither a success nor a failure of the upstream
+            if breaker is not None:
+                breaker.release()
+            if endpoint is not None:
+                balancer.finished(endpoint, None)  # type: ignore
+            raise
+        except Exception:
+            if breaker is not None:
+                breaker.record(False)
+            if endpoint is not None:
+                balancer.finished(endpoint, False)  # type: ignore
+            raise
+        latency = time.perf_counter() - start
+        state.observe_latency(latency)
+        if breaker is not None:
+            breaker.record(res.status < 500)
+        if endpoint is not None:
+            balancer.state.observe_latency(latency)  # type: ignore
+            balancer.finished(endpoint, res.status < 500)  # type: ignore
+        return res
+
+    async def _hedged(self, delay: float, method: str, url: str, *, retry: bool = False, **kw) -> ClientResponse:
+        '''
+        Issues a request and if it doesn't complete within delay a second identical one,
+        returning the first successful (non-5xx) response
+        '''
+        attempts = [asyncio.ensure_future(self._attempt(method, url, retry=retry, **kw))]
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done:
+            attempts.append(asyncio.ensure_future(self._attempt(method, url, **kw)))
+        winner = None
+        try:
+            pending = set(attempts)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status < 500:
+                        winner = task
+                        break
+            if winner is None:
+                # Every attempt failed -- report the first one as an unhedged request would
+                winner = attempts[0]
+            return winner.result()
+        finally:
+            for task in attempts:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    task.result().release()
+
+    def _hedge_delay(self, method: str, url: str, kw: dict) -> Optional[float]:
+        if not self._config.hedge or method not in COALESCABLE_METHODS or not BODY_KWARGS.isdisjoint(kw):
+            return None
+        # Balanced requests hedge on the latency of all endpoints together
+        state = self._balancer.state if self._balancer is not None else self._host_state(url)
+        return state.hedge_delay(self._config.hedge_quantile)
+
+    async def _request(self, method: str, url: str, *, retry: bool = False, **kw) -> ClientResponse:
+        '''Issues a single request attempt (possibly hedged), retry marks attempts after the first'''
+        delay = self._hedge_delay(method, url, kw)
+        if delay is None:
+            return await self._attempt(method, url, retry=retry, **kw)
+        return await self._hedged(delay, method, url, retry=retry, **kw)
+
+    async def _retryable_request(self, method: str, url: str, *, retry: bool = False, **kw) -> ClientResponse:
+        '''
+        Issues a single request attempt
+        Responses with a status matching config.retry_codes are buffered
+        (which returns their connection to the pool) and signalled for retry
+        '''
+        res = await self._request(method, url, retry=retry, **kw)
+        if self._config.should_retry(res.status):
+            await res.read()
+            raise ShouldRetry(res)
+        return res
+
+    @return_from_signal
+    async def _send(self, method: str, url: str, **kw) -> ClientResponse:
+        '''
+        Issues a request retrying it according to the session config
+        Requests that can't be replayed safely (see SessionConfig.can_retry) are sent once
+        '''
+        if not self._config.can_retry(method, kw):
+            return await self._request(method, url, **kw)
+        attempts = itertools.count()
+
+        async def _next_attempt() -> ClientResponse:
+            return await self._retryable_request(method, url, retry=next(attempts) > 0, **kw)
+        retrying = AsyncRetrying(
+            retry=retry_if_exception_type((ShouldRetry, *self._config.retry_errors)),
+            **self._config.retry_policy
+        )
+        return await retrying(_next_attempt)
+
+    async def _send_buffered(self, method: str, url: str, **kw) -> ClientResponse:
+        '''
+        Issues a request and reads the whole body so the response can be shared
+        Reading the body to the end returns the connection to the pool
+        '''
+        res = await self._send(method, url, **kw)
+        await res.read()
+        return res
+
+    async def _send_cached(self, key: Hashable, url: str, **kw) -> ClientResponse:
+        '''
+        Serves a GET request from config.response_cache if the stored response is fresh,
+        otherwise revalidates it with a conditional request (or fetches and stores it)
+        '''
+        cache = cast(ResponseCache, self._config.response_cache)
+        entry = await cache.get(key)
+        if entry is not None and entry.fresh:
+            # CachedResponse mirrors the reading API of ClientResponse
+            return cast(ClientResponse, CachedResponse(entry))
+        if entry is not None:
+            kw['headers'] = {**(kw.get('headers') or {}), **entry.validators()}
+        res = await self._send_buffered('GET', url, **kw)
+        if res.status == 304 and entry is not None:
+            refreshed = entry.revalidated(res.headers)
+            if refreshed is None:
+                await cache.delete(key)
+            else:
+                await cache.set(key, refreshed)
+            return cast(ClientResponse, CachedResponse(refreshed or entry))
+        fetched = CachedEntry.from_response(res, await res.read())
+        if fetched is not None:
+            await cache.set(key, fetched)
+        return res
+
+    @staticmethod
+    def _request_key(method: str, url: str, kw: dict) -> Optional[Hashable]:
+        '''
+        Returns a key identifying an idempotent request
+        or None if the request should be neither coalesced nor cached
+        '''
+        if method not in COALESCABLE_METHODS or not COALESCABLE_KWARGS.issuperset(kw):
+            return None
+        target = URL(url)
+        if kw.get('params'):
+            target = target.update_query(kw['params'])
+        headers = tuple(sorted((str(k).lower(), str(v))
+                               for k, v in (kw.get('headers') or {}).items()))
+        return (method, str(target), headers)
+
     @asynccontextmanager
-    async def issue(self, method: str, path: str, **kw) -> AsyncIterator[ClientResponse]:
-        '''A generic request issue method'''
+    async def issue(self,
+                    method: str,
+                    path: str,
+                    *,
+                    stream: bool = False,
+                    **kw) -> AsyncIterator[ClientResponse]:
+        '''
+        A generic request issue method
+        If single_flight is enabled, concurrent identical GET/HEAD requests share one
+        upstream call and receive the same (fully buffered) response
+        If response_cache is set, GET requests are served from/stored in the cache
+        Pass stream=True to always get an unbuffered response (see client.streaming)
+        '''
         url = f'{self._baseurl}{path}'
-        async with self._sess.request(method, url, **kw) as res:
+        method = method.upper()
+        key = None if stream else self._request_key(method, url, kw)
+        fetch: Optional[Callable[[], Awaitable[ClientResponse]]] = None
+        if key is not None and method == 'GET' and self._config.response_cache is not None:
+            fetch = lambda: self._send_cached(key, url, **kw)
+        elif key is not None and self._config.single_flight:
+            fetch = lambda: self._send_buffered(method, url, **kw)
+        if fetch is None:
+            res = await self._send(method, url, **kw)
+        elif self._config.single_flight:
+            res = await self._flights.do(key, fetch)
+        else:
+            res = await fetch()
+        try:
             yield res
+        finally:
+            if fetch is None:
+                # Buffered responses may be shared and have released their connection already
+                res.release()
+
+    async def download(self, path: str, target: StreamTarget, *, method: str = 'GET', **kw) -> int:
+        '''
+        Streams response body into target (a file path or a writable object)
+        with constant memory, returning the number of bytes written
+        '''
+        async with self.issue(method, path, stream=True, **kw) as res:
+            res.raise_for_status()
+            return await stream_to(res, target)
 
     def post(self, *a, **kw) -> AsyncContextManager[ClientResponse]:
         '''Issues a post request'''
@@ -0,0 +1,140 @@
+'''Per upstream host circuit breaking and hedged requests'''
+from __future__ import annotations
+from typing import Optional
+from dataclasses import dataclass
+from enum import Enum
+import time
+
+from ..exceptions import SerializableException
+from ..metrics import Histogram
+
+# Latency samples after which hedge delay histogram is rotated, so it follows the upstream
+HEDGE_WINDOW = 1000
+HEDGE_MIN_SAMPLES = 20
+
+
+class CircuitOpenError(SerializableException):
+    '''Raised instead of issuing a request to an upstream host whose circuit is open'''
+    _http_status = 503
+
+
+class CircuitState(Enum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+
+@dataclass
+class CircuitBreakerConfig:
+    '''
+    Circuit breaker settings
+      window             -- seconds of request outcomes the failure rate is computed over
+      buckets            -- number of buckets the window is split into
+      min_requests       -- minimum number of requests in the window to open the circuit
+      failure_rate       -- failure rate (connection errors, timeouts, 5xx) opening the circuit
+      open_for           -- seconds the circuit stays open before letting probes through
+      half_open_requests -- number of probe requests let through when half-open
+    '''
+    window: float = 10.
+    buckets: int = 10
+    min_requests: int = 20
+    failure_rate: float = .5
+    open_for: float = 5.
+    half_open_requests: int = 1
+
+
+class CircuitBreaker:
+    '''Closed/open/half-open circuit breaker over a sliding window of bucketed outcomes'''
+    __slots__ = ('config', 'state', '_width', '_epochs', '_successes', '_failures',
+                 '_changed_at', '_probes')
+    def __init__(self, config: CircuitBreakerConfig) -> None:
+        self.config = config
+        self.state = CircuitState.CLOSED
+        self._width = config.window / config.buckets
+        self._epochs = [-1] * config.buckets
+        self._successes = [0] * config.buckets
+        self._failures = [0] * config.buckets
+        self._changed_at = 0.
+        self._probes = 0
+
+    def allow(self) -> bool:
+        '''Checks whether a request may be issued (counting it as a probe when half-open)'''
+        if self.state is CircuitState.CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self._changed_at >= self.config.open_for:
+            # Open circuit cooled down, or half-open probes never reported back
+            self._transition(CircuitState.HALF_OPEN, now)
+        if self.state is CircuitState.HALF_OPEN and self._probes < self.config.half_open_requests:
+            self._probes += 1
+            return True
+        return False
+
+    def release(self) -> None:
+        '''Gives back the probe slot of a request that ended without an outcome (cancelled)'''
+        if self.state is CircuitState.HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    def record(self, success: bool) -> None:
+        now = time.monotonic()
+        if self.state is CircuitState.HALF_OPEN:
+            if success:
+                self._reset_window()
+            self._transition(CircuitState.CLOSED if success else CircuitState.OPEN, now)
+            return
+        epoch = int(now / self._width)
+        index = epoch % self.config.buckets
+        if self._epochs[index] != epoch:
+            self._epochs[index] = epoch
+            self._successes[index] = self._failures[index] = 0
+        if success:
+            self._successes[index] += 1
+            return
+        self._failures[index] += 1
+        if self.state is CircuitState.CLOSED:
+            successes, failures = self._totals(epoch)
+            total = successes + failures
+            if total >= self.config.min_requests and failures / total >= self.config.failure_rate:
+                self._transition(CircuitState.OPEN, now)
+
+    def _totals(self, epoch: int):
+        successes = failures = 0
+        for index, bucket_epoch in enumerate(self._epochs):
+            if epoch - bucket_epoch < self.config.buckets:
+                successes += self._successes[index]
+                failures += self._failures[index]
+        return successes, failures
+
+    def _reset_window(self) -> None:
+        for index in range(self.config.buckets):
+            self._epochs[index] = -1
+            self._successes[index] = self._failures[index] = 0
+
+    def _transition(self, state: CircuitState, now: float) -> None:
+        self.state = state
+        self._changed_at = now
+        self._probes = 0
+
+
+class HostState:
+    '''Resilience state kept by RequestEngine per upstream origin'''
+    __slots__ = ('origin', 'breaker', 'latency', '_previous_latency')
+    def __init__(self, origin: str, breaker_config: Optional[CircuitBreakerConfig]) -> None:
+        self.origin = origin
+        self.breaker = CircuitBreaker(breaker_config) if breaker_config is not None else None
+        self.latency = Histogram()
+        self._previous_latency: Optional[Histogram] = None
+
+    def observe_latency(self, latency: float) -> None:
+        if self.latency.count >= HEDGE_WINDOW:
+            self._previous_latency, self.latency = self.latency, Histogram()
+        self.latency.observe(latency)
+
+    def hedge_delay(self, quantile: float) -> Optional[float]:
+        '''Returns the latency quantile to hedge after, None until enough samples were seen'''
+        histogram = self.latency
+        if histogram.count < HEDGE_MIN_SAMPLES:
+            histogram = self._previous_latency  # type: ignore
+            if histogram is None:
+                return None
+        return histogram.quantile(quantile)
@@ -0,0 +1,86 @@
+'''Constant-memory consumption of large response payloads'''
+from __future__ import annotations
+from typing import Any, AsyncIterator, BinaryIO, Callable, Optional, Union
+import inspect
+import asyncio
+import os
+
+from aiohttp import ClientResponse
+
+from ..json import get_codec
+from .cache import CachedResponse
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+StreamTarget = Union[str, 'os.PathLike[str]', BinaryIO, Any]
+
+
+def _buffered_body(res: ClientResponse) -> Optional[bytes]:
+    '''Returns the body of responses that were already read (shared, cached or retried ones)'''
+    if isinstance(res, CachedResponse):
+        return res.body
+    return getattr(res, '_body', None)
+
+
+async def iter_chunks(res: ClientResponse, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    '''Iterates over response body in chunks of at most chunk_size bytes'''
+    body = _buffered_body(res)
+    if body is not None:
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+        return
+    async for chunk in res.content.iter_chunked(chunk_size):
+        yield chunk
+
+
+async def iter_lines(res: ClientResponse, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    '''Iterates over lines (without line endings) of the response body'''
+    pending = b''
+    async for chunk in iter_chunks(res, chunk_size):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(b'\r')
+    if pending:
+        yield pending.rstrip(b'\r')
+
+
+async def iter_ndjson(res: ClientResponse,
+                      *,
+                      loads: Optional[Callable[[Union[str, bytes]], Any]] = None,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Any]:
+    '''
+    Iterates over documents of a NDJSON / JSON-lines response, skipping blank lines
+    Lines are parsed with the default json codec unless loads is passed
+    '''
+    loads = loads or get_codec().loads
+    async for line in iter_lines(res, chunk_size):
+        if line.strip():
+            yield loads(line)
+
+
+async def stream_to(res: ClientResponse,
+                    target: StreamTarget,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    '''
+    Writes the response body into target returning the number of bytes written
+    target can be a file path (written from the default executor so the loop isn't blocked)
+    or any object with a write method (awaited if it returns an awaitable)
+    '''
+    if isinstance(target, (str, os.PathLike)):
+        loop = asyncio.get_event_loop()
+        file = await loop.run_in_executor(None, open, target, 'wb')
+        try:
+            written = 0
+            async for chunk in iter_chunks(res, chunk_size):
+                await loop.run_in_executor(None, file.write, chunk)
+                written += len(chunk)
+            return written
+        finally:
+            await loop.run_in_executor(None, file.close)
+    written = 0
+    async for chunk in iter_chunks(res, chunk_size):
+        result = target.write(chunk)
+        if inspect.isawaitable(result):
+            await result
+        written += len(chunk)
+    return written
@@ -0,0 +1,136 @@
+'''Per-host request phase timings collected through aiohttp.TraceConfig'''
+from typing import Dict, List, Tuple
+from types import SimpleNamespace
+import asyncio
+
+from aiohttp import ClientSession, TraceConfig
+
+from ..metrics import format_labels, Histogram, render_histogram
+
+PHASES = ('pool_wait', 'dns', 'connect', 'ttfb', 'transfer', 'total')
+QUANTILES = (.5, .95, .99)
+
+
+class HostTimings:
+    '''
+    Phase histograms of a single upstream host (seconds)
+      pool_wait -- waiting for a free connection in the pool
+      dns       -- resolving the host name (cache misses only)
+      connect   -- establishing a new connection including TLS handshake
+      ttfb      -- from sending request headers to receiving response headers
+      transfer  -- reading the body (recorded when the body is read as a whole)
+      total     -- from request start to response headers
+    '''
+    __slots__ = ('phases', 'requests', 'errors', 'retries')
+    def __init__(self) -> None:
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+
+
+class RequestTracer:
+    '''
+    Collects per host phase timings, error and retry counts of requests
+    issued through RequestEngine (pass it as SessionConfig.tracer)
+    Results can be queried in-process with snapshot() or exported with render()
+    '''
+    def __init__(self) -> None:
+        self.hosts: Dict[str, HostTimings] = {}
+
+    def for_host(self, host: str) -> HostTimings:
+        try:
+            return self.hosts[host]
+        except KeyError:
+            timings = self.hosts[host] = HostTimings()
+            return timings
+
+    def record_retry(self, host: str) -> None:
+        self.for_host(host).retries += 1
+
+    def trace_config(self) -> TraceConfig:
+        '''Returns TraceConfig feeding this tracer, to be passed to aiohttp.ClientSession'''
+        config = TraceConfig()
+        config.on_request_start.append(self._on_request_start)
+        config.on_connection_queued_start.append(self._mark('queued'))
+        config.on_connection_queued_end.append(self._measure('pool_wait', 'queued'))
+        config.on_dns_resolvehost_start.append(self._mark('dns'))
+        config.on_dns_resolvehost_end.append(self._measure('dns', 'dns'))
+        config.on_connection_create_start.append(self._mark('connect'))
+        config.on_connection_create_end.append(self._measure('connect', 'connect'))
+        config.on_request_headers_sent.append(self._mark('sent'))
+        config.on_request_end.append(self._on_request_end)
+        config.on_response_chunk_received.append(self._on_response_read)
+        config.on_request_exception.append(self._on_request_exception)
+        return config
+
+    @staticmethod
+    def _now() -> float:
+        return asyncio.get_event_loop().time()
+
+    def _mark(self, name: str):
+        async def _on_event(session: ClientSession, ctx: SimpleNamespace, params) -> None:
+            setattr(ctx, name, self._now())
+        return _on_event
+
+    def _measure(self, phase: str, mark: str):
+        async def _on_event(session: ClientSession, ctx: SimpleNamespace, params) -> None:
+            started = getattr(ctx, mark, None)
+            if started is not None:
+                ctx.timings.phases[phase].observe(self._now() - started)
+        return _on_event
+
+    async def _on_request_start(self, session: ClientSession, ctx: SimpleNamespace, params) -> None:
+        ctx.start = self._now()
+        ctx.timings = self.for_host(params.url.host or '')
+        ctx.timings.requests += 1
+
+    async def _on_request_end(self, session: ClientSession, ctx: SimpleNamespace, params) -> None:
+        now = ctx.headers_received = self._now()
+        ctx.timings.phases['ttfb'].observe(now - getattr(ctx, 'sent', ctx.start))
+        ctx.timings.phases['total'].observe(now - ctx.start)
+
+    async def _on_response_read(self, session: ClientSession, ctx: SimpleNamespace, params) -> None:
+        received = getattr(ctx, 'headers_received', None)
+        if received is not None:
+            ctx.timings.phases['transfer'].observe(self._now() - received)
+            ctx.headers_received = None
+
+    async def _on_request_exception(self, session: ClientSession, ctx: SimpleNamespace, params) -> None:
+        ctx.timings.errors += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, dict]]:
+        '''Returns counts, sums and p50/p95/p99 of every phase per host'''
+        return {
+            host: {
+                'requests': {'count': timings.requests},
+                'errors': {'count': timings.errors},
+                'retries': {'count': timings.retries},
+                **{phase: {'count': histogram.count,
+                           'sum': histogram.sum,
+                           **{f'p{int(q * 100)}': histogram.quantile(q) for q in QUANTILES}}
+                   for phase, histogram in timings.phases.items()}
+            }
+            for host, timings in self.hosts.items()
+        }
+
+    def render(self, prefix: str = 'http_client') -> str:
+        '''Renders collected metrics in Prometheus text exposition format'''
+        lines: List[str] = []
+        counters: Tuple[Tuple[str, str], ...] = (('requests', 'Requests started'),
+                                                 ('errors', 'Requests failed with an exception'),
+                                                 ('retries', 'Requests retried'))
+        for counter, description in counters:
+            name = f'{prefix}_{counter}_total'
+            lines += [f'# HELP {name} {description} by host', f'# TYPE {name} counter']
+            lines += [f'{name}{{{format_labels([("host", host)])}}} {getattr(timings, counter)}'
+                      for host, timings in self.hosts.items()]
+        name = f'{prefix}_phase_duration_seconds'
+        lines += [f'# HELP {name} Request phase duration by host', f'# TYPE {name} histogram']
+        for host, timings in self.hosts.items():
+            for phase, histogram in timings.phases.items():
+                if histogram.count:
+                    lines += render_histogram(name,
+                                              format_labels([('host', host), ('phase', phase)]),
+                                              histogram)
+        return '\n'.join(lines) + '\n'
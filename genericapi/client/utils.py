@@ -1,16 +1,20 @@
 '''Utility functions and classes for core generic-cli'''
-from typing import Any, Awaitable, Callable, cast, Dict, Tuple, TypeVar, Union
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple, Optional, Tuple, TypeVar
 from functools import wraps
 import inspect
+import asyncio
 import logging
+import weakref
 import time
 
+from ..singleflight import SingleFlight
+from ..lru import LRUCache
+
 log = logging.getLogger(__name__)
 T = TypeVar('T')
-AsyncMethod = Callable[[Any], Awaitable[T]]
-AsyncFunc = Callable[[], Awaitable[T]]
-CacheKey = Union[AsyncFunc, Tuple[object, AsyncMethod]]
-AsyncCallable = Union[AsyncMethod, AsyncFunc]
+AsyncCallable = Callable[..., Awaitable[T]]
+DEFAULT_MAXSIZE = 1024
+_KWARGS_MARK = object()
 
 
 def minutes(mins: float) -> float:
@@ -23,43 +27,126 @@ def cache_for(seconds: float) -> 'CacheFor':
     return CacheFor(seconds)
 
 
-class CacheFor:
+def async_cache(ttl: float, *, maxsize: int = DEFAULT_MAXSIZE, stale_ttl: float = 0) -> 'AsyncCache':
+    '''Same as AsyncCache()'''
+    return AsyncCache(ttl, maxsize=maxsize, stale_ttl=stale_ttl)
+
+
+def _make_key(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Hashable:
+    if not kwargs:
+        return args
+    return args + (_KWARGS_MARK,) + tuple(sorted(kwargs.items()))
+
+
+class _Entry(NamedTuple):
+    value: Any
+    expires_at: float
+    stale_until: float
+
+
+_Store = Tuple[LRUCache, SingleFlight]
+
+
+class AsyncCache:
     '''
-    Caches function response for the amount of seconds
-    specified in timeout argument passed to the class constructor
+    Caches coroutine function results per call arguments
+      ttl       -- seconds a result is served as fresh
+      maxsize   -- maximum number of results kept per function (or per instance for methods),
+                   least recently used results are evicted first
+      stale_ttl -- seconds after ttl during which the stale result is still served
+                   while a single background refresh is running
+    Concurrent misses for the same arguments share one call.
+    Methods (first argument named self) get a separate cache per instance,
+    which is dropped as soon as the instance is garbage collected.
+    Pass no_cache=True to the decorated function to force a refresh.
     '''
-    _func_cache: Dict[CacheKey, Any] = {}
-    _func_timestamps: Dict[CacheKey, float] = {}
-    def __init__(self, timeout: float) -> None:
-        self.timeout = timeout
-
-    def __call__(self, func: AsyncCallable) -> AsyncCallable:
-        sig = inspect.signature(func)
-        params = sig.parameters
-        if len(params) == 1 and 'self' in params:
-            return self._decorate_method(cast(AsyncMethod, func))
-        if not params:
-            return self._decorate_func(cast(AsyncFunc, func))
-        raise TypeError('CacheFor can be called on a method or function with no arguments only!'
-                        f' Detected signature: {str(sig)}')
-
-    def _decorate_func(self, func: AsyncFunc[T]) -> AsyncFunc[T]:
+    def __init__(self, ttl: float, *, maxsize: int = DEFAULT_MAXSIZE, stale_ttl: float = 0) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+
+    def __call__(self, func: AsyncCallable[T]) -> AsyncCallable[T]:
+        params = list(inspect.signature(func).parameters)
+        if params and params[0] == 'self':
+            return self._decorate_method(func)
+        return self._decorate_func(func)
+
+    def _new_store(self) -> _Store:
+        return LRUCache(self.maxsize), SingleFlight()
+
+    def _decorate_func(self, func: AsyncCallable[T]) -> AsyncCallable[T]:
+        store = self._new_store()
+
         @wraps(func)
-        async def _func_wrapper(no_cache: bool = False) -> T:
-            next_call_ts = self._func_timestamps.get(func, 0)
-            if no_cache or next_call_ts <= time.time():
-                self._func_cache[func] = await func()
-                self._func_timestamps[func] = time.time() + self.timeout
-            return self._func_cache[func]
+        async def _func_wrapper(*a, no_cache: bool = False, **kw) -> T:
+            return await self._get(store, _make_key(a, kw), lambda: func(*a, **kw), no_cache)
+        _func_wrapper.cache_clear = store[0].clear  # type: ignore
         return _func_wrapper
 
-    def _decorate_method(self, func: AsyncMethod[T]) -> AsyncMethod[T]:
+    def _decorate_method(self, func: AsyncCallable[T]) -> AsyncCallable[T]:
+        # Keyed on id() with a finalizer so that the cache never keeps an instance alive
+        stores: Dict[int, _Store] = {}
+
+        def _get_store(instance: object) -> _Store:
+            try:
+                return stores[id(instance)]
+            except KeyError:
+                pass
+            # The finalizer goes first -- a store of an instance that can't be tracked
+            # would outlive it and be handed to the next object with the same id
+            try:
+                weakref.finalize(instance, stores.pop, id(instance), None)
+            except TypeError:
+                raise TypeError(f'cache_for can\'t cache methods of {type(instance).__name__!r} objects, '
+                                'they don\'t support weak references (add \'__weakref__\' to __slots__)') from None
+            store = stores[id(instance)] = self._new_store()
+            return store
+
         @wraps(func)
-        async def _method_wrapper(self, no_cache: bool = False) -> T:
-            key = (self, func)
-            next_call_ts = self._func_timestamps.get(key, 0)
-            if no_cache or next_call_ts <= time.time():
-                self._func_cache[key] = await func(self)
-                self._func_timestamps[key] = time.time() + self.timeout
-            return self._func_cache[key]
+        async def _method_wrapper(instance, *a, no_cache: bool = False, **kw) -> T:
+            return await self._get(_get_store(instance), _make_key(a, kw),
+                                   lambda: func(instance, *a, **kw), no_cache)
+        _method_wrapper.cache_clear = stores.clear  # type: ignore
         return _method_wrapper
+
+    async def _get(self,
+                   store: _Store,
+                   key: Hashable,
+                   call: Callable[[], Awaitable[T]],
+                   no_cache: bool) -> T:
+        results, flights = store
+        entry: Optional[_Entry] = results.get(key)
+        if entry is not None and not no_cache:
+            now = time.monotonic()
+            if now < entry.expires_at:
+                return entry.value
+            if now < entry.stale_until:
+                if key not in flights:
+                    refresh = asyncio.ensure_future(flights.do(key, lambda: self._load(results, key, call)))
+                    refresh.add_done_callback(_log_refresh_error)
+                return entry.value
+        return await flights.do(key, lambda: self._load(results, key, call))
+
+    async def _load(self, results: LRUCache, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        value = await call()
+        now = time.monotonic()
+        results[key] = _Entry(value, now + self.ttl, now + self.ttl + self.stale_ttl)
+        return value
+
+
+def _log_refresh_error(fut: asyncio.Future) -> None:
+    if not fut.cancelled() and fut.exception() is not None:
+        log.error('background cache refresh failed', exc_info=fut.exception())
+
+
+class CacheFor(AsyncCache):
+    '''
+    Caches function response for the amount of seconds
+    specified in timeout argument passed to the class constructor
+    '''
+    def __init__(self, timeout: float, **kw) -> None:
+        super().__init__(timeout, **kw)
+
+    @property
+    def timeout(self) -> float:
+        return self.ttl
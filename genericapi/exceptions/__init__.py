@@ -1 +1 @@
-from .serializable import SerializableException
+from .serializable import SerializableException, RemoteError, register_exception
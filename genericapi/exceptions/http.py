@@ -2,7 +2,7 @@ from typing import Any, Mapping, Optional, Union
 
 import aiohttp.web
 
-from ..json import autojson
+from ..json import get_codec
 
 JSONValue = Union[str, int, float, bool, dict, list, tuple, None]
 
@@ -23,7 +23,7 @@ class JSONResponseMixin(aiohttp.web.HTTPException):
                    'Message': msg,
                    'Blame': blame,
                    **params}
-        super().__init__(text=autojson.dumps(payload),
+        super().__init__(body=get_codec().dumps(payload),
                          headers=headers,
                          reason=reason,
                          content_type='application/json')
@@ -83,7 +83,7 @@ class HTTPOk(aiohttp.web.HTTPOk):
             headers: Optional[Mapping[str, Any]] = None,
             reason: Optional[str] = None
     ) -> None:
-        super().__init__(text=autojson.dumps(payload),
+        super().__init__(body=get_codec().dumps(payload),
                          headers=headers,
                          reason=reason,
                          content_type='application/json')
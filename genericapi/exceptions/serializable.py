@@ -1,18 +1,45 @@
 from __future__ import annotations
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple, Type, TypeVar
 from functools import wraps
 from pprint import pformat
-import importlib
+import builtins
 import logging
 
-from aiohttp.web import json_response, Response
-from aiohttp import ClientResponse
+from aiohttp.web import Response
+from aiohttp import ClientResponse, ContentTypeError
 
 from ..types import AsyncRouteHandler
-from ..json import autojson
+from ..json import get_codec
 
 log = logging.getLogger(__name__)
 
+ExcType = TypeVar('ExcType', bound=Type[Exception])
+# Exception classes that can be deserialized, keyed by (module, qualname)
+# Populated by SerializableException subclasses and register_exception
+_registry: Dict[Tuple[str, str], Type[Exception]] = {}
+
+
+def register_exception(exc_class: ExcType) -> ExcType:
+    '''
+    Allows deserialization of exc_class (usable as a class decorator)
+    SerializableException subclasses and builtin exceptions are allowed implicitly
+    '''
+    _registry[exc_class.__module__, exc_class.__qualname__] = exc_class
+    return exc_class
+
+
+def resolve_exception(module: str, name: str) -> Optional[Type[Exception]]:
+    '''Returns the registered exception class (or builtin exception) module.name, None if not allowed'''
+    try:
+        return _registry[module, name]
+    except KeyError:
+        pass
+    if module == 'builtins':
+        exc_class = getattr(builtins, name, None)
+        if isinstance(exc_class, type) and issubclass(exc_class, Exception):
+            return register_exception(exc_class)
+    return None
+
 
 def with_exception_serializer(handler: AsyncRouteHandler) -> AsyncRouteHandler:
     '''
@@ -32,9 +59,13 @@ def with_exception_serializer(handler: AsyncRouteHandler) -> AsyncRouteHandler:
 async def from_error_res(res: ClientResponse, blame: str = 'server') -> Exception:
     '''Turns a serializable-error response into a serializable error'''
     try:
-        payload = await res.json(loads=autojson.loads)
-    except ValueError:
-        log.exception('Received non-autojson error response:\n%s', await res.text())
+        payload = await res.json(loads=get_codec().loads)
+    except (ValueError, ContentTypeError):
+        text = await res.text()
+        log.error('Received non-json error response (%d):\n%s', res.status, text)
+        return RemoteError(text or res.reason or 'non-json error response', code=res.status)
+    if not isinstance(payload, dict):
+        return RemoteError(f'unexpected error response: {payload!r}', code=res.status)
     return SerializableException.deserialize_exc(payload, status=res.status)
 
 
@@ -53,6 +84,10 @@ class SerializableException(Exception):
     _http_status: int
     exc_args: list = []
     exc_kwargs: Dict[str, Any] = {}
+    def __init_subclass__(cls, **kw) -> None:
+        super().__init_subclass__(**kw)
+        register_exception(cls)
+
     def __new__(cls, *a, **kw) -> SerializableException:
         instance = super().__new__(cls, *a, **kw)
         instance.exc_args = list(a)
@@ -79,7 +114,9 @@ class SerializableException(Exception):
             status = exc.http_status
         else:
             payload['exc']['args'] = [str(exc)]
-        return json_response(payload, status=status, dumps=autojson.dumps)
+        return Response(body=get_codec().dumps(payload),
+                        status=status,
+                        content_type='application/json')
 
     @staticmethod
     def serialize_exc(exc: Exception) -> Dict[str, str]:
@@ -90,11 +127,41 @@ class SerializableException(Exception):
 
     @staticmethod
     def deserialize_exc(exc_payload: Dict[str, Any], status: int) -> Exception:
+        '''
+        Recreates the exception described by exc_payload
+        Only registered exception classes are instantiated -- any other
+        (or not instantiable) exception is returned as a RemoteError
+        '''
         if exc_payload.get('status') != 'error':
             raise NotAnError()
         exc = exc_payload.get('exc')
-        if exc is None:
+        if not isinstance(exc, dict):
             raise ValueError(f'received an error response that is not deserializable!\n{pformat(exc_payload)}!')
-        exc_module = importlib.import_module(exc.pop('module'))
-        exc_class = getattr(exc_module, exc.pop('class'))
-        return exc_class(*exc.get('args') or (), **exc.get('kwargs') or {})
+        module, name = exc.get('module'), exc.get('class')
+        exc_class = resolve_exception(module, name) if isinstance(module, str) and isinstance(name, str) else None
+        if exc_class is not None:
+            try:
+                return exc_class(*exc.get('args') or (), **exc.get('kwargs') or {})
+            except TypeError:
+                log.warning('Could not instantiate %s.%s from error response', module, name)
+        return RemoteError(exc.get('message') or exc_payload.get('message') or '',
+                           code=status,
+                           exc_class=name,
+                           exc_module=module)
+
+
+class RemoteError(SerializableException):
+    '''
+    An error response whose exception could not be recreated locally
+    (the class is not registered, or the body is not a serialized exception)
+    '''
+    _http_status = 500
+    def __init__(self,
+                 message: str,
+                 code: int = 0,
+                 status: str = 'error',
+                 exc_class: Optional[str] = None,
+                 exc_module: Optional[str] = None) -> None:
+        super().__init__(message, code=code, status=status)
+        self.exc_class = exc_class
+        self.exc_module = exc_module
@@ -1,7 +1,86 @@
+'''
+JSON backend selection
+autojson is the text (str) based module kept for backwards compatibility,
+codecs serialize straight to bytes and are picked from a registry
+(orjson is preferred when installed)
+The default codec is process-wide: it serializes the responses of every API
+(HTTPOk, HTTPError, serialized exceptions) and is changed with set_default_codec
+'''
+from typing import Any, Callable, Dict, List, Optional, Union
+from dataclasses import dataclass
+import json
+
 try:
     import ujson as autojson
 except ModuleNotFoundError:
     try:
         import simplejson as autojson
     except ModuleNotFoundError:
-        import autojson
+        try:
+            import autojson
+        except ModuleNotFoundError:
+            autojson = json  # type: ignore
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+
+@dataclass(frozen=True)
+class JSONCodec:
+    '''A JSON backend dumping to bytes and loading from str or bytes'''
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[Union[str, bytes]], Any]
+
+    def dumps_text(self, obj: Any) -> str:
+        return self.dumps(obj).decode('utf-8')
+
+
+_codecs: Dict[str, JSONCodec] = {}
+_default_codec: Optional[JSONCodec] = None
+
+
+def register_codec(codec: JSONCodec, *, default: bool = False) -> None:
+    '''Registers codec under its name, optionally making it the default one'''
+    global _default_codec  # pylint: disable=global-statement
+    _codecs[codec.name] = codec
+    if default or _default_codec is None:
+        _default_codec = codec
+
+
+def get_codec(name: Optional[str] = None) -> JSONCodec:
+    '''Returns codec registered under name or the default codec'''
+    if name is None:
+        return _default_codec  # type: ignore
+    try:
+        return _codecs[name]
+    except KeyError:
+        raise ValueError(f'unknown json codec {name!r}, available: {sorted(_codecs)}') from None
+
+
+def available_codecs() -> List[str]:
+    '''Returns names of registered codecs'''
+    return list(_codecs)
+
+
+def set_default_codec(name: str) -> JSONCodec:
+    '''Makes a registered codec the default one (for the whole process)'''
+    codec = get_codec(name)
+    register_codec(codec, default=True)
+    return codec
+
+
+if orjson is not None:
+    # Non-string keys are dumped as strings, like the other backends do
+    register_codec(JSONCodec('orjson',
+                             lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+                             orjson.loads))
+if autojson is not json:
+    register_codec(JSONCodec(autojson.__name__,
+                             lambda obj: autojson.dumps(obj).encode('utf-8'),
+                             autojson.loads))
+register_codec(JSONCodec('json',
+                         lambda obj: json.dumps(obj, separators=(',', ':')).encode('utf-8'),
+                         json.loads))
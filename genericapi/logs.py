@@ -0,0 +1,231 @@
+'''
+Structured logging pipeline
+Records are put on a bounded queue by the logging thread (the event loop) and
+formatted as JSON lines and written in batches by a writer thread. Repeated
+exceptions are sampled and records that don't fit the queue are dropped and
+counted instead of blocking the loop
+'''
+from typing import Any, Dict, Hashable, IO, List, Optional, Tuple
+import traceback
+import threading
+import logging
+import asyncio
+import queue
+import time
+import sys
+
+from .json import get_codec
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 256
+POLL_INTERVAL = .5
+EXC_BURST = 5
+EXC_PERIOD = 60.
+STOP_TIMEOUT = 5.
+# LogRecord attributes that are not user supplied extras
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    '''Formats records as single line json objects (extras included)'''
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {'ts': record.created,
+                                 'level': record.levelname,
+                                 'logger': record.name,
+                                 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exc'] = ''.join(traceback.format_exception(*record.exc_info))
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+        return get_codec().dumps_text(entry)
+
+
+class ExceptionSampler(logging.Filter):
+    '''
+    Lets through at most burst records per period for each repeated exception
+    (same logger, call site and exception type), the next record let through
+    carries the number of records suppressed in between
+    '''
+    def __init__(self, burst: int = EXC_BURST, period: float = EXC_PERIOD) -> None:
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.suppressed = 0
+        self._windows: Dict[Hashable, List[Any]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not record.exc_info or record.exc_info[0] is None:
+            return True
+        key = (record.name, record.pathname, record.lineno, record.exc_info[0])
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.period:
+            # [window start, records let through, records suppressed]
+            window = self._windows[key] = [now, 0, window[2] if window is not None else 0]
+        if window[1] >= self.burst:
+            window[2] += 1
+            self.suppressed += 1
+            return False
+        window[1] += 1
+        if window[2]:
+            record.suppressed = window[2]
+            window[2] = 0
+        return True
+
+
+class QueueingHandler(logging.Handler):
+    '''Puts records on the pipeline queue without blocking, counting the ones that don't fit'''
+    def __init__(self, records: 'queue.Queue[Optional[logging.LogRecord]]') -> None:
+        super().__init__()
+        self.records = records
+        self.dropped = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Arguments are merged now, as they may change before the writer gets to them;
+        # the (expensive) traceback formatting is left to the writer
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            self.records.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+
+class LogPipeline:
+    '''
+    Root logger handler writing json lines to stream from a writer thread
+    Started and stopped by API/Client -- it's reference counted, so one pipeline
+    can be shared by everything running in the process
+    '''
+    def __init__(self,
+                 stream: Optional[IO[str]] = None,
+                 *,
+                 queue_size: int = QUEUE_SIZE,
+                 batch_size: int = BATCH_SIZE,
+                 exc_burst: int = EXC_BURST,
+                 exc_period: float = EXC_PERIOD) -> None:
+        self.stream = stream
+        self.batch_size = batch_size
+        self.formatter = JSONFormatter()
+        self.sampler = ExceptionSampler(exc_burst, exc_period)
+        self._records: 'queue.Queue[Optional[logging.LogRecord]]' = queue.Queue(queue_size)
+        self.handler = QueueingHandler(self._records)
+        self.handler.addFilter(self.sampler)
+        self._refs = 0
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._stopping: Optional[threading.Event] = None
+
+    @property
+    def dropped(self) -> int:
+        '''Records dropped because the queue was full'''
+        return self.handler.dropped
+
+    @property
+    def suppressed(self) -> int:
+        '''Repeated exceptions suppressed by sampling'''
+        return self.sampler.suppressed
+
+    def start(self) -> None:
+        with self._lock:
+            self._refs += 1
+            if self._refs > 1:
+                return
+            self._stopping = threading.Event()
+            self._writer = threading.Thread(target=self._write, args=(self._stopping,),
+                                            name='log-writer', daemon=True)
+            self._writer.start()
+            logging.getLogger().addHandler(self.handler)
+
+    def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        '''
+        Detaches the pipeline once every owner stopped it, writing out queued records
+        Waits at most timeout seconds for the writer -- it's a daemon thread, whatever
+        it doesn't write by then is lost on exit. Blocking, use stop_async on a loop
+        '''
+        with self._lock:
+            if self._refs == 0:
+                return
+            self._refs -= 1
+            if self._refs:
+                return
+            logging.getLogger().removeHandler(self.handler)
+            writer, self._writer = self._writer, None
+            if self._stopping is not None:
+                self._stopping.set()
+            try:
+                # Wakes the writer up, with a full queue it stops once the queue is drained
+                self._records.put_nowait(None)
+            except queue.Full:
+                pass
+        if writer is not None:
+            writer.join(timeout)
+            if writer.is_alive():
+                logging.getLogger(__name__).warning('Log writer did not finish in %.0fs, %d records queued',
+                                                    timeout, self._records.qsize())
+
+    async def stop_async(self, timeout: float = STOP_TIMEOUT) -> None:
+        '''stop run in the default executor of the loop, so the loop isn't blocked'''
+        await asyncio.get_event_loop().run_in_executor(None, self.stop, timeout)
+
+    def _write(self, stopping: threading.Event) -> None:
+        while True:
+            batch, done = self._next_batch()
+            if batch:
+                lines = []
+                for record in batch:
+                    try:
+                        lines.append(self.formatter.format(record))
+                    except Exception:  # pylint: disable=broad-except
+                        self.handler.handleError(record)
+                try:
+                    stream = self.stream or sys.stderr
+                    stream.write('\n'.join(lines) + '\n')
+                    stream.flush()
+                except Exception:  # pylint: disable=broad-except
+                    # A broken stream loses the batch but mustn't stop the writer
+                    self.handler.handleError(batch[-1])
+            if done or (stopping.is_set() and self._records.empty()):
+                return
+
+    def _next_batch(self) -> Tuple[List[logging.LogRecord], bool]:
+        '''Waits for a record, then takes whatever else is queued (up to batch_size)'''
+        try:
+            record = self._records.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            return [], False
+        batch: List[logging.LogRecord] = []
+        while record is not None:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            try:
+                record = self._records.get_nowait()
+            except queue.Empty:
+                return batch, False
+        return batch, True
+
+
+_pipeline: Optional[LogPipeline] = None
+
+
+def default_pipeline() -> LogPipeline:
+    '''Returns the pipeline shared by API and Client, creating it on first use'''
+    global _pipeline  # pylint: disable=global-statement
+    if _pipeline is None:
+        _pipeline = LogPipeline()
+    return _pipeline
+
+
+def configure_pipeline(**kw) -> LogPipeline:
+    '''Replaces the shared pipeline with one created with kw (see LogPipeline) unless it's running'''
+    global _pipeline  # pylint: disable=global-statement
+    if _pipeline is not None and _pipeline._refs:  # pylint: disable=protected-access
+        return _pipeline
+    _pipeline = LogPipeline(**kw)
+    return _pipeline
@@ -0,0 +1,86 @@
+'''Bounded least-recently-used mapping'''
+from typing import Callable, Generic, Hashable, Iterator, Optional, Tuple, TypeVar
+from collections import OrderedDict
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class LRUCache(Generic[K, V]):
+    '''
+    An ordered mapping that evicts least recently used items
+    once it holds more than max_items items or more than max_bytes bytes
+    (as measured by sizeof, which is required when max_bytes is set)
+    '''
+    __slots__ = ('_data', 'max_items', 'max_bytes', '_sizeof', 'size')
+    def __init__(self,
+                 max_items: Optional[int] = None,
+                 *,
+                 max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[V], int]] = None) -> None:
+        if max_bytes is not None and sizeof is None:
+            raise ValueError('sizeof is required when max_bytes is set')
+        self._data: 'OrderedDict[K, Tuple[V, int]]' = OrderedDict()
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self._data)
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        '''Returns value stored under key marking it as most recently used'''
+        try:
+            value, _ = self._data[key]
+        except KeyError:
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def __getitem__(self, key: K) -> V:
+        value, _ = self._data[key]
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        size = self._sizeof(value) if self._sizeof is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Would evict everything else and still not fit
+            self.pop(key)
+            return
+        if key in self._data:
+            self.size -= self._data.pop(key)[1]
+        self._data[key] = (value, size)
+        self.size += size
+        self._evict()
+
+    def __delitem__(self, key: K) -> None:
+        self.size -= self._data.pop(key)[1]
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        '''Removes key returning its value or default'''
+        try:
+            value, size = self._data.pop(key)
+        except KeyError:
+            return default
+        self.size -= size
+        return value
+
+    def clear(self) -> None:
+        '''Removes all items'''
+        self._data.clear()
+        self.size = 0
+
+    def _evict(self) -> None:
+        while self._data and (
+                (self.max_items is not None and len(self._data) > self.max_items)
+                or (self.max_bytes is not None and self.size > self.max_bytes)):
+            _, (_, size) = self._data.popitem(last=False)
+            self.size -= size
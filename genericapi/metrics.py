@@ -0,0 +1,79 @@
+'''Low overhead in-process metric primitives with Prometheus text rendering'''
+from typing import Iterable, List, Sequence, Tuple
+from bisect import bisect_left
+
+# Seconds
+DEFAULT_LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+
+class Histogram:
+    '''
+    Fixed-bucket histogram
+    Bucket counts are preallocated so observing a value allocates nothing
+    '''
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+    def __init__(self, bounds: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        self.bounds = tuple(sorted(bounds))
+        # Last bucket holds values above the highest bound (+Inf)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        '''Returns (upper bound, cumulative count) pairs, the last bound being +Inf'''
+        pairs = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q: float) -> float:
+        '''Estimates q-quantile (0 < q <= 1) interpolating linearly within a bucket'''
+        if not self.count:
+            return 0.
+        rank = q * self.count
+        lower, seen = 0., 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.bounds):
+                    return self.bounds[-1] if self.bounds else 0.
+                upper = self.bounds[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            if index < len(self.bounds):
+                lower = self.bounds[index]
+        return lower
+
+    def reset(self) -> None:
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.
+        self.count = 0
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    return ','.join(f'{name}="{escape_label(value)}"' for name, value in labels)
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def render_histogram(name: str, labels: str, histogram: Histogram) -> List[str]:
+    '''Renders histogram samples in Prometheus text format (labels are preformatted)'''
+    prefix = f'{labels},' if labels else ''
+    lines = [f'{name}_bucket{{{prefix}le="{_format_bound(bound)}"}} {count}'
+             for bound, count in histogram.cumulative()]
+    suffix = f'{{{labels}}}' if labels else ''
+    lines.append(f'{name}_sum{suffix} {histogram.sum}')
+    lines.append(f'{name}_count{suffix} {histogram.count}')
+    return lines
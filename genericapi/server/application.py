@@ -2,20 +2,39 @@
 All classes extending aiohttp.web.Application
 with simplified initialization and setup
 '''
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import logging.config
 import logging
 import asyncio
+import socket
+import os
 
-from aiohttp_swagger import setup_swagger
 from aiohttp.web import Application
-from envparse import Env
-import aiolog
+from envparse import ConfigurationError, Env
 
+from ..json import get_codec, JSONCodec
+from ..logs import configure_pipeline, LogPipeline
+from .runner import create_socket, run_worker, RunnerConfig, Supervisor
+from .limiter import AdaptiveLimiter, LoadShedder
+from .compression import Compressor
+from .cors import PrecompiledCors
+from .executors import use_executors
+from .watchdog import LoopWatchdog
+from .metrics import RouteMetrics
+from .swagger import LazySwaggerSpec, setup_lazy_swagger
+from .validation import load_spec, SwaggerValidators
+from .resources import Resources
 from .routes import RouteManager
 
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
 log = logging.getLogger(__name__)
 
+_MISSING = object()
+
 
 class API(Application):
     def __init__(self,
@@ -24,30 +43,80 @@ class API(Application):
                  settings: Optional[Dict[str, Any]] = None,
                  envdefinition: Optional[Dict[str, Dict[str, Any]]] = None,
                  **kw) -> None:
-        super().__init__(**kw)
-        self.name = name
-        self.settings = settings or {}
-        self.route_manager = RouteManager(self, root=prefix)
-        self.env = Env(
+        env = Env(
             **dict(
                 dict(
                     PORT=dict(default=5000, cast=str),
                     LOG_LEVEL=dict(default='WARNING', cast=str),
                     LOGGING_CONF=dict(default=None, cast=str),
+                    LOG_FORMAT=dict(default='text', cast=str),
+                    LOG_QUEUE_SIZE=dict(default=10000, cast=int),
+                    LOG_EXC_BURST=dict(default=5, cast=int),
+                    LOG_EXC_PERIOD=dict(default=60., cast=float),
                     SWAGGER_FILE=dict(default='./api/config/swagger.yml', cast=str),
                     SWAGGER_URL=dict(default='api/doc', cast=str),
                     SWAGGER_ENABLED=dict(default=False, cast=bool),
+                    VALIDATION_ENABLED=dict(default=False, cast=bool),
+                    VALIDATE_RESPONSES=dict(default=False, cast=bool),
+                    CORS_PRECOMPILED=dict(default=False, cast=bool),
+                    RESPONSE_CACHE_MAX_BYTES=dict(default=32 * 1024 * 1024, cast=int),
+                    METRICS_ENABLED=dict(default=False, cast=bool),
+                    METRICS_URL=dict(default='/metrics', cast=str),
+                    LOAD_SHEDDING_ENABLED=dict(default=False, cast=bool),
+                    CONCURRENCY_LIMIT=dict(default=100, cast=int),
+                    CONCURRENCY_LIMIT_MIN=dict(default=10, cast=int),
+                    CONCURRENCY_LIMIT_MAX=dict(default=1000, cast=int),
+                    COMPRESSION_ENABLED=dict(default=False, cast=bool),
+                    COMPRESSION_MIN_SIZE=dict(default=1024, cast=int),
+                    THREAD_POOL_SIZE=dict(default=0, cast=int),
+                    PROCESS_POOL_SIZE=dict(default=0, cast=int),
+                    LOOP_BLOCK_THRESHOLD=dict(default=0., cast=float),
+                    CLIENT_MAX_SIZE=dict(default=1024 ** 2, cast=int),
+                    KEEPALIVE_TIMEOUT=dict(default=75., cast=float),
+                    BACKLOG=dict(default=128, cast=int),
+                    REUSE_PORT=dict(default=True, cast=bool),
+                    ACCESS_LOG=dict(default=True, cast=bool),
+                    ACCESS_LOG_SAMPLE=dict(default=1., cast=float),
+                    SHUTDOWN_TIMEOUT=dict(default=60., cast=float),
                     ENVIRONMENT=dict(cast=str)
                 ),
                 **envdefinition or {}
             )
         )
+        settings = settings or {}
+        # Request body size limit is fixed when aiohttp.web.Application is created
+        kw.setdefault('client_max_size', int(settings.get('client_max_size') or env('CLIENT_MAX_SIZE')))
+        super().__init__(**kw)
+        self.env = env
+        self.name = name
+        self.settings = settings
+        self.metrics: Optional[RouteMetrics] = None
+        self.load_shedder: Optional[LoadShedder] = None
+        self.compressor: Optional[Compressor] = None
+        self.thread_pool: Optional[ThreadPoolExecutor] = None
+        self.process_pool: Optional['ProcessPoolExecutor'] = None
+        # Default executor of the loop before start_executors, restored by stop_executors
+        self._previous_executor: Optional[ThreadPoolExecutor] = None
+        self.swagger: Optional[LazySwaggerSpec] = None
+        self.log_pipeline: Optional[LogPipeline] = None
+        self.watchdog: Optional[LoopWatchdog] = None
+        self.resources = Resources()
+        # Filled by resolve_config at setup
+        self._config: Dict[str, Any] = {}
+        self.route_manager = RouteManager(self,
+                                          root=prefix,
+                                          precompiled_cors=self.config('cors_precompiled'),
+                                          cache_max_bytes=int(self.config('response_cache_max_bytes')))
 
     async def __aenter__(self) -> 'API':
         return await self.open()
 
     async def open(self) -> 'API':
+        self.start_executors()
         await self.setup()
+        await self.resources.open()
+        # Started last -- synchronous startup work (spec parsing etc.) isn't a blocked loop
+        self.start_watchdog()
         log.info('Application %r setup completed...', self.name)
         return self
 
@@ -55,25 +124,177 @@ class API(Application):
         return await self.close()
 
     async def close(self) -> None:
-        pass
+        await self.resources.close()
+        await self.stop_executors()
+        if self.log_pipeline is not None:
+            await self.log_pipeline.stop_async()
+            self.log_pipeline = None
+
+    def start_executors(self) -> None:
+        '''
+        Starts the thread pool (THREAD_POOL_SIZE workers, python's default sizing if 0)
+        which becomes the default executor of the loop and the process pool if
+        PROCESS_POOL_SIZE is set
+        See executors.offload
+        '''
+        loop = asyncio.get_event_loop()
+        self.thread_pool = ThreadPoolExecutor(int(self.config('thread_pool_size')) or None,
+                                              thread_name_prefix=self.name)
+        # asyncio has no public getter of the default executor
+        self._previous_executor = getattr(loop, '_default_executor', None)
+        loop.set_default_executor(self.thread_pool)
+        if int(self.config('process_pool_size')):
+            # Imported here as it pulls in multiprocessing machinery most apps never use
+            from concurrent.futures import ProcessPoolExecutor  # pylint: disable=import-outside-toplevel
+            self.process_pool = ProcessPoolExecutor(int(self.config('process_pool_size')))
+        use_executors(self.thread_pool, self.process_pool)
+
+    def start_watchdog(self) -> None:
+        '''Starts the loop watchdog if LOOP_BLOCK_THRESHOLD is set (see watchdog.LoopWatchdog)'''
+        if float(self.config('loop_block_threshold')):
+            self.watchdog = LoopWatchdog(float(self.config('loop_block_threshold')))
+            self.watchdog.start()
+
+    async def stop_executors(self) -> None:
+        '''
+        Stops the loop watchdog and shuts down pools started by start_executors
+        The loop gets its previous default executor back (or a fresh one), so it stays
+        usable after the API closes, and running jobs are waited for without blocking it
+        '''
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            self.watchdog = None
+        use_executors(None, None)
+        loop = asyncio.get_event_loop()
+        if self.thread_pool is not None:
+            loop.set_default_executor(self._previous_executor or ThreadPoolExecutor())
+        self._previous_executor = None
+        for pool in (self.process_pool, self.thread_pool):
+            if pool is not None:
+                await loop.run_in_executor(None, partial(pool.shutdown, wait=True))
+        self.thread_pool = self.process_pool = None
+
+    @property
+    def json_codec(self) -> JSONCodec:
+        '''
+        JSON codec used to serialize responses -- the process-wide default codec,
+        changed with genericapi.json.set_default_codec
+        '''
+        return get_codec()
+
+    def runner_config(self) -> RunnerConfig:
+        '''
+        Connection lifecycle settings of the server: KEEPALIVE_TIMEOUT, BACKLOG, REUSE_PORT,
+        ACCESS_LOG (0 disables it), ACCESS_LOG_SAMPLE (fraction of non-5xx requests logged)
+        and SHUTDOWN_TIMEOUT (seconds in-flight requests get to finish on shutdown)
+        '''
+        return RunnerConfig(keepalive_timeout=float(self.config('keepalive_timeout')),
+                            backlog=int(self.config('backlog')),
+                            reuse_port=bool(self.config('reuse_port')),
+                            access_log=bool(self.config('access_log')),
+                            access_log_sample=float(self.config('access_log_sample')),
+                            shutdown_timeout=float(self.config('shutdown_timeout')))
+
+    def run(self,
+            *,
+            host: str = '0.0.0.0',
+            port: Optional[int] = None,
+            use_uvloop: bool = False,
+            config: Optional[RunnerConfig] = None) -> None:
+        '''Serves the API from this process blocking until SIGTERM/SIGINT (see serve)'''
+        self.serve(1, host=host, port=port, use_uvloop=use_uvloop, config=config)
+
+    def serve(self,
+              workers: Optional[int] = None,
+              *,
+              host: str = '0.0.0.0',
+              port: Optional[int] = None,
+              use_uvloop: bool = False,
+              config: Optional[RunnerConfig] = None) -> None:
+        '''
+        Serves the API blocking until SIGTERM/SIGINT
+          workers    -- number of worker processes (defaults to number of cores),
+                        each worker opens and closes its own copy of the app
+          host       -- interface to listen on
+          port       -- port to listen on (defaults to PORT)
+          use_uvloop -- use uvloop event loop in workers if it's installed
+          config     -- keepalive, backlog, access log and shutdown settings
+                        (defaults to runner_config())
+        With more than one worker, workers are forked, share the port via SO_REUSEPORT
+        and are restarted when they die
+        On shutdown workers stop accepting connections and wait for in-flight requests
+        '''
+        workers = workers or os.cpu_count() or 1
+        port = int(port or self.config('port'))
+        config = config or self.runner_config()
+        if workers == 1:
+            run_worker(self, host=host, port=port, use_uvloop=use_uvloop, config=config)
+            return
+        # Without SO_REUSEPORT workers accept on a socket inherited from the supervisor
+        sock = None
+        if not (config.reuse_port and hasattr(socket, 'SO_REUSEPORT')):
+            sock = create_socket(host, port, reuse_port=False, backlog=config.backlog)
+        Supervisor(partial(run_worker, self, host=host, port=port, sock=sock, use_uvloop=use_uvloop, config=config),
+                   workers).run()
 
     async def setup(self) -> None:
+        self.resolve_config()
         self.setup_logging()
-        self.setup_swagger()
+        self.setup_compression()
+        self.setup_load_shedding()
+        self.setup_metrics()
+        self.setup_cors()
+        spec = self.setup_validation()
+        self.setup_swagger(spec)
+        self.setup_resources()
         self.setup_routes()
 
     def config(self, key: str) -> Any:
-        '''Retrieve key from config'''
+        '''Retrieve key from config (settings, then env) -- resolved once at setup'''
+        value = self._config.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
         try:
             return self.settings[key]
         except KeyError:
             return self.env(key.upper())
 
+    def resolve_config(self) -> None:
+        '''
+        Resolves (and casts) settings and env definition values once, later config()
+        calls are dict lookups -- settings changed afterwards take effect after another call
+        Env variables without a default that aren't set are left to fail when asked for
+        '''
+        self._config = {}
+        for key in set(self.settings) | {name.lower() for name in self.env.schema}:
+            try:
+                self._config[key] = self.config(key)
+            except ConfigurationError:
+                pass
+
+    def setup_resources(self) -> None:
+        '''
+        Registers shared resources and request-scoped dependencies on self.resources
+        Resources are created when the API opens (after setup) and closed with it, e.g.
+            self.resources.add('users', lambda: Client(self.config('users_url')))
+        '''
+
     def setup_logging(self) -> None:
         '''
         Sets up logging using file specified in settings['logging_conf'] or env LOGGING_CONF
         and sets the root log-level to LOG_LEVEL (default=WARNING)
+        With LOG_FORMAT=json records are written as json lines by the shared LogPipeline
+        (see genericapi.logs) instead, repeated exceptions are sampled
+        (at most LOG_EXC_BURST per LOG_EXC_PERIOD seconds)
         '''
+        if self.config('log_format') == 'json':
+            self.log_pipeline = configure_pipeline(queue_size=int(self.config('log_queue_size')),
+                                                   exc_burst=int(self.config('log_exc_burst')),
+                                                   exc_period=float(self.config('log_exc_period')))
+            self.log_pipeline.start()
+            logging.getLogger().setLevel(self.config('log_level'))
+            return
+        import aiolog  # pylint: disable=import-outside-toplevel
         aiolog.start(loop=asyncio.get_event_loop())
         aiolog.setup_aiohttp(self)
         if self.config('logging_conf'):
@@ -88,15 +309,86 @@ class API(Application):
             logging.getLogger('aiobotocore').setLevel(max(logging.INFO,
                                                           logging.getLevelName(self.config('log_level'))))
 
-    def setup_swagger(self) -> None:
-        '''Setup swagger if its enabled'''
+    def setup_swagger(self, spec: Optional[Dict[str, Any]] = None) -> None:
+        '''
+        Setup swagger if its enabled -- the spec file is parsed when docs are first requested
+        unless it was parsed for validation already (spec)
+        '''
         if self.config('swagger_enabled'):
             url = self.config('swagger_url')
             file = self.config('swagger_file')
             log.info('Setting up swagger from file %r [url: %r]', file, url)
-            setup_swagger(self,
-                          swagger_url=url,
-                          swagger_from_file=file)
+            self.swagger = setup_lazy_swagger(self,
+                                              swagger_url=url,
+                                              swagger_file=file,
+                                              spec=spec)
+
+    def setup_validation(self) -> Optional[Dict[str, Any]]:
+        '''
+        Setup request validation against SWAGGER_FILE if VALIDATION_ENABLED
+        (and of 200 responses, logging mismatches, if VALIDATE_RESPONSES)
+        Routes described in the spec get validators compiled on registration
+        Returns the parsed spec
+        '''
+        if not self.config('validation_enabled'):
+            return None
+        file = self.config('swagger_file')
+        log.info('Setting up request validation from file %r', file)
+        spec = load_spec(file)
+        self.route_manager.validators = SwaggerValidators(spec,
+                                                          validate_responses=self.config('validate_responses'))
+        return spec
+
+    def setup_compression(self) -> None:
+        '''
+        Setup response compression middleware if COMPRESSION_ENABLED
+        compressing bodies of at least COMPRESSION_MIN_SIZE bytes
+        '''
+        if self.config('compression_enabled'):
+            self.compressor = Compressor(min_size=int(self.config('compression_min_size')))
+            log.info('Setting up compression [encodings: %s]', ', '.join(self.compressor.encodings))
+            self.middlewares.insert(0, self.compressor.middleware)
+
+    def setup_load_shedding(self) -> None:
+        '''
+        Setup adaptive concurrency limiting middleware if LOAD_SHEDDING_ENABLED
+        starting at CONCURRENCY_LIMIT and staying within CONCURRENCY_LIMIT_MIN/MAX
+        Route priorities are taken from RouteManager.add_route
+        '''
+        if self.config('load_shedding_enabled'):
+            limiter = AdaptiveLimiter(int(self.config('concurrency_limit')),
+                                      min_limit=int(self.config('concurrency_limit_min')),
+                                      max_limit=int(self.config('concurrency_limit_max')))
+            log.info('Setting up load shedding [initial limit: %d]', limiter.limit)
+            self.load_shedder = LoadShedder(limiter, self.route_manager.priorities)
+            self.middlewares.insert(0, self.load_shedder.middleware)
+
+    def setup_cors(self) -> None:
+        '''
+        Makes the precompiled CORS middleware (CORS_PRECOMPILED) the outermost one, so that
+        responses of other middlewares (e.g. load shedding 503s) carry CORS headers too
+        '''
+        cors = self.route_manager.cors
+        if isinstance(cors, PrecompiledCors):
+            self.middlewares.remove(cors.middleware)
+            self.middlewares.insert(0, cors.middleware)
+
+    def setup_metrics(self) -> None:
+        '''
+        Setup per-route metrics middleware and Prometheus endpoint (at METRICS_URL)
+        if METRICS_ENABLED
+        '''
+        if self.config('metrics_enabled'):
+            url = self.config('metrics_url')
+            log.info('Setting up metrics [url: %r]', url)
+            self.metrics = RouteMetrics()
+            # Outermost but CORS, so that time spent in other middlewares is accounted for
+            self.middlewares.insert(0, self.metrics.middleware)
+            self.route_manager.add_route(method='GET',
+                                         path=url,
+                                         handler=self.metrics.handler,
+                                         name='metrics',
+                                         no_cors=True)
 
     def setup_routes(self) -> None:
         raise NotImplementedError()
@@ -0,0 +1,148 @@
+'''
+Caching of route handler responses
+Serialized responses of GET/HEAD handlers are kept for ttl seconds in a byte
+bounded LRU, keyed on method, path, query and selected request headers.
+Concurrent misses run the handler once, and responses carry an ETag so clients
+can revalidate with If-None-Match
+'''
+from typing import Hashable, Iterable, Optional, Tuple, Union
+from dataclasses import dataclass
+from functools import wraps
+import hashlib
+import time
+
+from aiohttp.web import HTTPException, Request, Response, StreamResponse
+from aiohttp import hdrs
+
+from ..singleflight import SingleFlight
+from ..types import AsyncRouteHandler
+from ..lru import LRUCache
+
+CACHEABLE_METHODS = frozenset({hdrs.METH_GET, hdrs.METH_HEAD})
+CACHEABLE_STATUSES = frozenset({200, 203})
+# Headers that are set per response and not stored
+UNCACHED_HEADERS = frozenset(h.upper() for h in (hdrs.CONTENT_LENGTH, hdrs.DATE, hdrs.SERVER,
+                                                 hdrs.TRANSFER_ENCODING, hdrs.SET_COOKIE))
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class CachedHandlerResponse:
+    '''A serialized handler response'''
+    status: int
+    headers: Tuple[Tuple[str, str], ...]
+    body: bytes
+    etag: str
+    expires_at: float
+
+    @classmethod
+    def from_response(cls, response: StreamResponse, ttl: float) -> Optional['CachedHandlerResponse']:
+        '''Serializes response, returns None if it's not cacheable'''
+        if (not isinstance(response, Response) or response.status not in CACHEABLE_STATUSES
+                or not isinstance(response.body, bytes) or hdrs.SET_COOKIE in response.headers):
+            return None
+        body = response.body
+        etag = response.headers.get(hdrs.ETAG) or f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        headers = tuple((name, value) for name, value in response.headers.items()
+                        if name.upper() not in UNCACHED_HEADERS and name.upper() != hdrs.ETAG.upper())
+        return cls(response.status, headers, body, etag, time.monotonic() + ttl)
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers)
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    def to_response(self, request: Request) -> Response:
+        '''Builds a response to request -- 304 if it matches the ETag'''
+        if_none_match = request.headers.get(hdrs.IF_NONE_MATCH)
+        if if_none_match is not None and _etag_matches(self.etag, if_none_match):
+            return Response(status=304, headers={hdrs.ETAG: self.etag})
+        response = Response(status=self.status, body=self.body, headers=self.headers)
+        response.headers[hdrs.ETAG] = self.etag
+        return response
+
+
+def _etag_matches(etag: str, if_none_match: str) -> bool:
+    if if_none_match.strip() == '*':
+        return True
+    # Weak comparison, as If-None-Match asks for
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == etag:
+            return True
+    return False
+
+
+class HandlerCache:
+    '''Byte bounded store of handler responses shared by the handlers cached in it'''
+    __slots__ = ('_entries', '_flights')
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self._entries: LRUCache[Hashable, CachedHandlerResponse] = LRUCache(
+            max_bytes=max_bytes,
+            sizeof=lambda entry: entry.size
+        )
+        self._flights = SingleFlight()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def wrap(self, handler: AsyncRouteHandler, ttl: float, vary: Iterable[str] = ()) -> AsyncRouteHandler:
+        '''Returns handler caching its GET/HEAD responses for ttl seconds'''
+        vary = tuple(vary)
+
+        @wraps(handler)
+        async def _cached(request: Request) -> StreamResponse:
+            if request.method not in CACHEABLE_METHODS:
+                return await handler(request)
+            key = (request.method,
+                   request.path,
+                   tuple(sorted(request.query.items())),
+                   tuple(request.headers.get(name) for name in vary))
+            entry = self._entries.get(key)
+            if entry is not None and entry.fresh:
+                return entry.to_response(request)
+            own: Optional[Union[StreamResponse, HTTPException]] = None
+
+            async def _fetch() -> Optional[CachedHandlerResponse]:
+                nonlocal own
+                try:
+                    own = await handler(request)
+                except HTTPException as exc:
+                    # HTTPOk and friends are raised
+                    own = exc
+                fetched = CachedHandlerResponse.from_response(own, ttl)
+                if fetched is not None:
+                    self._entries[key] = fetched
+                return fetched
+
+            entry = await self._flights.do(key, _fetch)
+            if entry is not None:
+                return entry.to_response(request)
+            if own is None:
+                # Joined a call whose response can't be shared
+                return await handler(request)
+            if isinstance(own, HTTPException):
+                raise own
+            return own
+        return _cached
+
+
+def cache_response(ttl: float,
+                   *,
+                   vary: Iterable[str] = (),
+                   cache: Optional[HandlerCache] = None):
+    '''
+    Handler decorator caching GET/HEAD responses for ttl seconds
+      vary  -- request headers the response depends on
+      cache -- HandlerCache to store responses in (a dedicated one by default)
+    '''
+    def _decorator(handler: AsyncRouteHandler) -> AsyncRouteHandler:
+        return (cache or HandlerCache()).wrap(handler, ttl, vary)
+    return _decorator
@@ -0,0 +1,159 @@
+'''
+Negotiated response compression
+Bodies are compressed with the best encoding the client accepts (zstd, br, gzip
+-- zstd and brotli only when installed), large bodies in an executor, and
+compressed bytes of repeated identical bodies are served from an LRU cache
+'''
+from typing import Callable, Dict, Hashable, Optional, Tuple
+from concurrent.futures import Executor
+import hashlib
+import asyncio
+import gzip
+
+from aiohttp.web import HTTPException, middleware, Request, Response, StreamResponse
+from aiohttp import hdrs
+
+from ..types import AsyncRouteHandler
+from ..lru import LRUCache
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+try:
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None
+
+MIN_SIZE = 1024
+# Bodies of at least that many bytes are compressed in the executor
+OFFLOAD_SIZE = 64 * 1024
+CACHE_BYTES = 16 * 1024 * 1024
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript',
+                      'application/xml', 'application/x-ndjson')
+
+
+def available_encodings() -> Dict[str, Callable[[bytes], bytes]]:
+    '''Returns installed encodings, most preferred first'''
+    encodings: Dict[str, Callable[[bytes], bytes]] = {}
+    if zstandard is not None:
+        # ZstdCompressor is not thread safe -- one per call
+        encodings['zstd'] = lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+    if brotli is not None:
+        encodings['br'] = lambda body: brotli.compress(body, quality=4)
+    encodings['gzip'] = lambda body: gzip.compress(body, compresslevel=6)
+    return encodings
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    '''Parses Accept-Encoding into {coding: q-value}'''
+    accepted: Dict[str, float] = {}
+    for item in header.split(','):
+        coding, *params = item.strip().split(';')
+        quality = 1.
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.
+        if coding:
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class Compressor:
+    '''
+    Middleware compressing Response (and raised HTTPException) bodies of at least
+    min_size bytes and of compressible content type
+    Streamed responses and already encoded responses are left untouched
+    '''
+    def __init__(self,
+                 *,
+                 min_size: int = MIN_SIZE,
+                 offload_size: int = OFFLOAD_SIZE,
+                 cache_bytes: int = CACHE_BYTES,
+                 executor: Optional[Executor] = None) -> None:
+        self.min_size = min_size
+        self.offload_size = offload_size
+        self.executor = executor
+        self.encodings = available_encodings()
+        self._negotiated: LRUCache[str, Optional[str]] = LRUCache(256)
+        self._cache: LRUCache[Hashable, bytes] = LRUCache(max_bytes=cache_bytes, sizeof=len)
+
+    def negotiate(self, accept_encoding: str) -> Optional[str]:
+        '''Picks the encoding for given Accept-Encoding header (None for identity)'''
+        try:
+            return self._negotiated[accept_encoding]
+        except KeyError:
+            pass
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get('*', 0.)
+        best, best_quality = None, 0.
+        for encoding in self.encodings:
+            quality = accepted.get(encoding, wildcard)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        self._negotiated[accept_encoding] = best
+        return best
+
+    def _compressible(self, response: StreamResponse) -> bool:
+        if not isinstance(response, Response) or hdrs.CONTENT_ENCODING in response.headers:
+            return False
+        body = response.body
+        return (isinstance(body, bytes) and len(body) >= self.min_size
+                and response.content_type.startswith(COMPRESSIBLE_TYPES))
+
+    async def compress(self, body: bytes, encoding: str) -> bytes:
+        '''Compresses body, from cache if an identical body was compressed before'''
+        key: Tuple[str, bytes] = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        compressed = self._cache.get(key)
+        if compressed is None:
+            compress = self.encodings[encoding]
+            if len(body) >= self.offload_size:
+                loop = asyncio.get_event_loop()
+                compressed = await loop.run_in_executor(self.executor, compress, body)
+            else:
+                compressed = compress(body)
+            self._cache[key] = compressed
+        return compressed
+
+    async def _apply(self, encoding: str, response: Response) -> None:
+        compressed = await self.compress(response.body, encoding)  # type: ignore
+        if len(compressed) >= len(response.body):  # type: ignore
+            return
+        response.body = compressed
+        headers = response.headers
+        headers[hdrs.CONTENT_ENCODING] = encoding
+        etag = headers.get(hdrs.ETAG)
+        if etag is not None and not etag.startswith('W/'):
+            # Compressed bytes differ from the identity representation
+            headers[hdrs.ETAG] = f'W/{etag}'
+
+    @middleware
+    async def middleware(self, request: Request, handler: AsyncRouteHandler) -> StreamResponse:
+        accept_encoding = request.headers.get(hdrs.ACCEPT_ENCODING)
+        encoding = self.negotiate(accept_encoding) if accept_encoding else None
+        try:
+            response = await handler(request)
+        except HTTPException as exc:
+            await self._negotiated_response(encoding, exc)
+            raise
+        await self._negotiated_response(encoding, response)
+        return response
+
+    async def _negotiated_response(self, encoding: Optional[str], response: StreamResponse) -> None:
+        '''
+        Compresses response if it's compressible and the client accepts an encoding
+        Compressible responses vary on Accept-Encoding whether compressed or not,
+        so shared caches don't serve one representation to clients expecting the other
+        '''
+        if not self._compressible(response):
+            return
+        vary = response.headers.get(hdrs.VARY, '')
+        if hdrs.ACCEPT_ENCODING.lower() not in (value.strip().lower() for value in vary.split(',')):
+            response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+        if encoding is not None:
+            await self._apply(encoding, response)  # type: ignore
@@ -0,0 +1,159 @@
+'''
+Precompiled CORS handling
+A middleware alternative to aiohttp_cors: per route options are turned into
+prebuilt header tuples once, and preflight requests are answered from a cache
+without entering the handler chain
+'''
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+from aiohttp.web import HTTPException, HTTPForbidden, middleware, Request, Response, StreamResponse
+from aiohttp.web_urldispatcher import AbstractResource, AbstractRoute
+from aiohttp import hdrs
+
+from ..types import AsyncRouteHandler
+from ..lru import LRUCache
+
+Headers = Tuple[Tuple[str, str], ...]
+SIMPLE_RESPONSE_HEADERS = frozenset(h.upper() for h in (hdrs.CACHE_CONTROL, hdrs.CONTENT_LANGUAGE,
+                                                          hdrs.CONTENT_TYPE, hdrs.EXPIRES,
+                                                          hdrs.LAST_MODIFIED, hdrs.PRAGMA))
+PREFLIGHT_CACHE_SIZE = 4096
+
+
+class CorsPolicy:
+    '''CORS options of a single origin entry (or '*') precompiled into header tuples'''
+    __slots__ = ('static_headers', 'expose_all', 'allow_methods', 'allow_headers', 'preflight_headers')
+    def __init__(self,
+                 *,
+                 allow_credentials: bool = False,
+                 expose_headers: Union[str, Iterable[str]] = (),
+                 allow_headers: Union[str, Iterable[str]] = (),
+                 max_age: Optional[int] = None,
+                 allow_methods: Union[None, str, Iterable[str]] = None) -> None:
+        self.expose_all = expose_headers == '*'
+        credentials: Headers = (((hdrs.ACCESS_CONTROL_ALLOW_CREDENTIALS, 'true'),)
+                                if allow_credentials else ())
+        exposed: Headers = ()
+        if not self.expose_all and expose_headers:
+            exposed = ((hdrs.ACCESS_CONTROL_EXPOSE_HEADERS, ','.join(expose_headers)),)
+        self.static_headers = exposed + credentials
+        self.preflight_headers = credentials + (((hdrs.ACCESS_CONTROL_MAX_AGE, str(max_age)),)
+                                                if max_age is not None else ())
+        self.allow_headers: Optional[FrozenSet[str]] = (
+            None if allow_headers == '*' else frozenset(h.upper() for h in allow_headers))
+        # None stands for any method
+        self.allow_methods: Optional[FrozenSet[str]] = (
+            None if allow_methods == '*' else frozenset(m.upper() for m in allow_methods or ()))
+
+    @classmethod
+    def compile(cls, cors_config: Mapping[str, Mapping]) -> Dict[str, 'CorsPolicy']:
+        '''Compiles raw cors config ({origin: options}) into policies'''
+        return {origin: cls(**options) for origin, options in cors_config.items()}
+
+    def apply(self, origin: str, response: StreamResponse) -> None:
+        '''Sets CORS headers of an actual (non-preflight) request on response'''
+        headers = response.headers
+        if self.expose_all:
+            exposed = [name for name in headers if name.upper() not in SIMPLE_RESPONSE_HEADERS]
+            if exposed:
+                headers[hdrs.ACCESS_CONTROL_EXPOSE_HEADERS] = ','.join(exposed)
+        headers.extend(self.static_headers)
+        headers[hdrs.ACCESS_CONTROL_ALLOW_ORIGIN] = origin
+        headers.add(hdrs.VARY, hdrs.ORIGIN)
+
+
+def _lookup(policies: Mapping[str, CorsPolicy], origin: str) -> Optional[CorsPolicy]:
+    return policies.get(origin) or policies.get('*')
+
+
+class PrecompiledCors:
+    '''
+    CORS middleware with per route precompiled policies
+    Routes are registered with add(); a preflight (OPTIONS) route is added to their
+    resource, preflight requests are then answered by the middleware directly
+    '''
+    def __init__(self, defaults: Mapping[str, Mapping]) -> None:
+        self.defaults = CorsPolicy.compile(defaults)
+        self._routes: Dict[AbstractRoute, Dict[str, CorsPolicy]] = {}
+        self._resources: Dict[AbstractResource, Dict[str, Dict[str, CorsPolicy]]] = {}
+        self._preflight_routes: Set[AbstractRoute] = set()
+        self._preflights: LRUCache[Hashable, Headers] = LRUCache(PREFLIGHT_CACHE_SIZE)
+
+    def add(self, route: AbstractRoute, cors_config: Optional[Mapping[str, Mapping]] = None) -> AbstractRoute:
+        '''Enables CORS on route with cors_config overriding the defaults per origin'''
+        policies = {**self.defaults, **CorsPolicy.compile(cors_config)} if cors_config else self.defaults
+        self._routes[route] = policies
+        resource = route.resource
+        if resource is not None:
+            if resource not in self._resources:
+                self._resources[resource] = {}
+                preflight = resource.add_route(hdrs.METH_OPTIONS, self.preflight_handler)  # type: ignore
+                self._preflight_routes.add(preflight)
+            self._resources[resource][route.method] = policies
+        return route
+
+    @middleware
+    async def middleware(self, request: Request, handler: AsyncRouteHandler) -> StreamResponse:
+        origin = request.headers.get(hdrs.ORIGIN)
+        if origin is None:
+            return await handler(request)
+        route = request.match_info.route
+        if route in self._preflight_routes:
+            return self._preflight(request, origin)
+        policies = self._routes.get(route)
+        policy = _lookup(policies, origin) if policies else None
+        if policy is None:
+            return await handler(request)
+        try:
+            response = await handler(request)
+        except HTTPException as exc:
+            policy.apply(origin, exc)
+            raise
+        policy.apply(origin, response)
+        return response
+
+    async def preflight_handler(self, request: Request) -> Response:
+        '''Handler of OPTIONS routes -- only reached by non-CORS OPTIONS requests'''
+        raise HTTPForbidden(text='CORS preflight request failed: origin header is not specified')
+
+    def _preflight(self, request: Request, origin: str) -> Response:
+        method = request.headers.get(hdrs.ACCESS_CONTROL_REQUEST_METHOD, '').upper()
+        requested_headers = request.headers.get(hdrs.ACCESS_CONTROL_REQUEST_HEADERS, '')
+        key = (request.match_info.route.resource, origin, method, requested_headers)
+        headers = self._preflights.get(key)
+        if headers is None:
+            headers = self._preflights[key] = self._compile_preflight(key[0], origin, method, requested_headers)
+        return Response(headers=headers)
+
+    def _compile_preflight(self,
+                           resource: AbstractResource,
+                           origin: str,
+                           method: str,
+                           requested_headers: str) -> Headers:
+        if not method:
+            raise HTTPForbidden(text='CORS preflight request failed: Access-Control-Request-Method is missing')
+        methods = self._resources.get(resource, {})
+        policies = methods.get(method) or methods.get(hdrs.METH_ANY)
+        if policies is None:
+            # Method has no route, but may still be explicitly allowed by the default policy
+            default = _lookup(self.defaults, origin)
+            if default is None or (default.allow_methods is not None and method not in default.allow_methods):
+                raise HTTPForbidden(text=f'CORS preflight request failed: '
+                                         f'request method {method!r} is not allowed for {origin!r} origin')
+            policies = self.defaults
+        policy = _lookup(policies, origin)
+        if policy is None:
+            raise HTTPForbidden(text=f'CORS preflight request failed: origin {origin!r} is not allowed')
+        wanted: List[str] = [h.strip().upper() for h in requested_headers.split(',') if h.strip()]
+        if policy.allow_headers is not None:
+            disallowed = set(wanted) - policy.allow_headers
+            if disallowed:
+                raise HTTPForbidden(text='CORS preflight request failed: headers are not allowed: '
+                                         + ', '.join(sorted(disallowed)))
+        headers: Headers = ((hdrs.ACCESS_CONTROL_ALLOW_ORIGIN, origin),
+                            *policy.preflight_headers,
+                            (hdrs.ACCESS_CONTROL_ALLOW_METHODS, method),
+                            (hdrs.VARY, hdrs.ORIGIN))
+        if wanted:
+            headers += ((hdrs.ACCESS_CONTROL_ALLOW_HEADERS, ','.join(wanted)),)
+        return headers
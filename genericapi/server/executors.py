@@ -0,0 +1,66 @@
+'''
+Offloading blocking work to the thread and process pools owned by API
+Functions decorated with offload become coroutine functions executed in a pool.
+Process pool calls refer to the function by name through a registry, so
+decorated module level functions stay picklable
+'''
+from typing import Any, Callable, Dict, Optional, TypeVar, cast
+from concurrent.futures import Executor
+from functools import partial, wraps
+import asyncio
+
+F = TypeVar('F', bound=Callable[..., Any])
+THREAD = 'thread'
+PROCESS = 'process'
+
+_executors: Dict[str, Optional[Executor]] = {THREAD: None, PROCESS: None}
+_offloaded: Dict[str, Callable[..., Any]] = {}
+
+
+def use_executors(thread_pool: Optional[Executor], process_pool: Optional[Executor]) -> None:
+    '''Sets the pools offloaded functions are executed in (called by API.open/close)'''
+    _executors[THREAD] = thread_pool
+    _executors[PROCESS] = process_pool
+
+
+def get_executor(pool: str) -> Optional[Executor]:
+    '''
+    Returns the executor of given pool
+    None for the thread pool means the default executor of the loop
+    '''
+    if pool not in _executors:
+        raise ValueError(f'unknown pool {pool!r} -- use {THREAD!r} or {PROCESS!r}')
+    executor = _executors[pool]
+    if executor is None and pool == PROCESS:
+        raise RuntimeError('no process pool is running -- set PROCESS_POOL_SIZE and open the API')
+    return executor
+
+
+def _call_offloaded(name: str, *a, **kw) -> Any:
+    '''Process pool entry point -- looks the function up in the registry of the worker'''
+    return _offloaded[name](*a, **kw)
+
+
+def offload(func: Optional[F] = None, *, pool: str = THREAD):
+    '''
+    Decorates a blocking function (or sync route handler) so that calling it
+    returns an awaitable executed in the thread or process pool
+    Functions offloaded to the process pool need to be defined at module level
+    and take and return picklable values (handlers can't use the process pool)
+    '''
+    def _decorator(fn: F) -> F:
+        name = f'{fn.__module__}:{fn.__qualname__}'
+        if pool == PROCESS:
+            _offloaded[name] = fn
+
+        @wraps(fn)
+        async def _offloaded_call(*a, **kw) -> Any:
+            loop = asyncio.get_event_loop()
+            executor = get_executor(pool)
+            if pool == PROCESS:
+                return await loop.run_in_executor(executor, partial(_call_offloaded, name, *a, **kw))
+            return await loop.run_in_executor(executor, partial(fn, *a, **kw))
+        return cast(F, _offloaded_call)
+    if func is not None:
+        return _decorator(func)
+    return _decorator
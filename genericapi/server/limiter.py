@@ -0,0 +1,108 @@
+'''Adaptive concurrency limiting and load shedding middleware'''
+from typing import Mapping, Optional, Union
+from enum import IntEnum
+import time
+
+from aiohttp.web import middleware, Request, StreamResponse
+from aiohttp.web_urldispatcher import AbstractRoute
+
+from ..exceptions.http import HTTPServiceUnavailable
+from ..types import AsyncRouteHandler
+
+
+class Priority(IntEnum):
+    '''Route priority -- lower priorities are shed first'''
+    LOW = 0
+    NORMAL = 1
+    HIGH = 2
+
+    @classmethod
+    def of(cls, priority: Union['Priority', str, int]) -> 'Priority':
+        if isinstance(priority, str):
+            return cls[priority.upper()]
+        return cls(priority)
+
+
+# Fraction of the concurrency limit requests of given priority may occupy
+PRIORITY_SHARE = {Priority.LOW: .5, Priority.NORMAL: .85, Priority.HIGH: 1.}
+
+
+class AdaptiveLimiter:
+    '''
+    AIMD concurrency limit driven by latency
+    The limit grows by about one per limit-many completed requests while the server
+    is utilised and latency stays within tolerance times the baseline (slowly drifting
+    minimum) latency, and is multiplied by backoff (at most once per cooldown) otherwise
+    '''
+    __slots__ = ('limit', 'min_limit', 'max_limit', 'tolerance', 'backoff', 'cooldown',
+                 'in_flight', 'baseline', '_last_decrease')
+    def __init__(self,
+                 initial: int = 100,
+                 *,
+                 min_limit: int = 10,
+                 max_limit: int = 1000,
+                 tolerance: float = 2.,
+                 backoff: float = .9,
+                 cooldown: float = .1) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self._last_decrease = 0.
+
+    def try_acquire(self, priority: Priority = Priority.NORMAL) -> bool:
+        if self.in_flight >= self.limit * PRIORITY_SHARE[priority]:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, latency: float) -> None:
+        utilised = self.in_flight * 2 >= self.limit
+        self.in_flight -= 1
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            # Let the baseline follow a permanent latency increase, slowly
+            self.baseline += (latency - self.baseline) * .001
+        if latency > self.baseline * self.tolerance:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        elif utilised:
+            self.limit = min(float(self.max_limit), self.limit + 1. / self.limit)
+
+
+class LoadShedder:
+    '''
+    Middleware admitting requests up to the adaptive concurrency limit
+    (scaled by route priority) and rejecting the rest straight away with
+    HTTPServiceUnavailable and a Retry-After header
+    '''
+    def __init__(self,
+                 limiter: AdaptiveLimiter,
+                 priorities: Mapping[AbstractRoute, Priority],
+                 *,
+                 retry_after: int = 1) -> None:
+        self.limiter = limiter
+        self.priorities = priorities
+        self.retry_after = str(retry_after)
+        self.shed = 0
+
+    @middleware
+    async def middleware(self, request: Request, handler: AsyncRouteHandler) -> StreamResponse:
+        priority = self.priorities.get(request.match_info.route, Priority.NORMAL)
+        if not self.limiter.try_acquire(priority):
+            self.shed += 1
+            raise HTTPServiceUnavailable('server overloaded -- request shed',
+                                         headers={'Retry-After': self.retry_after},
+                                         limit=int(self.limiter.limit))
+        start = time.perf_counter()
+        try:
+            return await handler(request)
+        finally:
+            self.limiter.release(time.perf_counter() - start)
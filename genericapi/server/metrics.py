@@ -0,0 +1,101 @@
+'''Per-route request metrics middleware exposed in Prometheus text format'''
+from typing import Dict, List
+import time
+
+from aiohttp.web import HTTPException, middleware, Request, Response, StreamResponse
+from aiohttp.web_urldispatcher import AbstractRoute
+
+from ..metrics import format_labels, Histogram, render_histogram
+from ..types import AsyncRouteHandler
+
+UNMATCHED_ROUTE = 'unmatched'
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def route_label(route: AbstractRoute) -> str:
+    '''Route name or its method and path pattern -- never the raw request path'''
+    if route.name:
+        return route.name
+    return f'{route.method} {route.resource.canonical}'  # type: ignore
+
+
+class RouteStats:
+    '''Counters of a single route, preallocated on first request'''
+    __slots__ = ('labels', 'in_flight', 'statuses', 'latency')
+    def __init__(self, label: str) -> None:
+        self.labels = format_labels([('route', label)])
+        self.in_flight = 0
+        self.statuses = [0] * len(STATUS_CLASSES)
+        self.latency = Histogram()
+
+    def observe(self, status: int, duration: float) -> None:
+        index = status // 100 - 1
+        if 0 <= index < len(STATUS_CLASSES):
+            self.statuses[index] += 1
+        self.latency.observe(duration)
+
+
+class RouteMetrics:
+    '''
+    Collects request counts per status class, in-flight gauge and latency histogram
+    per route (keyed on the matched route, labelled with its name or pattern)
+    Note that for streamed responses latency covers the handler only
+    '''
+    def __init__(self, prefix: str = 'http') -> None:
+        self.prefix = prefix
+        self._routes: Dict[AbstractRoute, RouteStats] = {}
+        self._unmatched = RouteStats(UNMATCHED_ROUTE)
+
+    def stats_for(self, route: AbstractRoute) -> RouteStats:
+        if route.resource is None:
+            # 404/405 get a new system route every request
+            return self._unmatched
+        try:
+            return self._routes[route]
+        except KeyError:
+            stats = self._routes[route] = RouteStats(route_label(route))
+            return stats
+
+    @middleware
+    async def middleware(self, request: Request, handler: AsyncRouteHandler) -> StreamResponse:
+        stats = self.stats_for(request.match_info.route)
+        stats.in_flight += 1
+        status = 500
+        start = time.perf_counter()
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except HTTPException as exc:
+            status = exc.status
+            raise
+        finally:
+            stats.in_flight -= 1
+            stats.observe(status, time.perf_counter() - start)
+
+    def render(self) -> str:
+        '''Renders all metrics in Prometheus text exposition format'''
+        requests = f'{self.prefix}_requests_total'
+        in_flight = f'{self.prefix}_requests_in_flight'
+        latency = f'{self.prefix}_request_duration_seconds'
+        all_stats = list(self._routes.values()) + [self._unmatched]
+        lines: List[str] = [f'# HELP {requests} Requests handled by route and status class',
+                            f'# TYPE {requests} counter']
+        for stats in all_stats:
+            for status_class, count in zip(STATUS_CLASSES, stats.statuses):
+                if count:
+                    lines.append(f'{requests}{{{stats.labels},status="{status_class}"}} {count}')
+        lines += [f'# HELP {in_flight} Requests currently being handled by route',
+                  f'# TYPE {in_flight} gauge']
+        lines += [f'{in_flight}{{{stats.labels}}} {stats.in_flight}' for stats in all_stats]
+        lines += [f'# HELP {latency} Request handling latency by route',
+                  f'# TYPE {latency} histogram']
+        for stats in all_stats:
+            if stats.latency.count:
+                lines += render_histogram(latency, stats.labels, stats.latency)
+        return '\n'.join(lines) + '\n'
+
+    async def handler(self, request: Request) -> Response:
+        '''Route handler serving the metrics'''
+        return Response(text=self.render(), headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
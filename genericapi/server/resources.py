@@ -0,0 +1,103 @@
+'''
+Resources shared by the handlers of an API
+Long-lived resources (Clients of downstream services, pools) are created when
+the API opens and closed with it, request-scoped dependencies are created at
+most once per request
+'''
+from typing import Any, Awaitable, Callable, Dict, Union
+import inspect
+import logging
+import asyncio
+
+from aiohttp.web import Request
+
+log = logging.getLogger(__name__)
+
+REQUEST_KEY = 'dependencies'
+
+ResourceFactory = Callable[[], Union[Any, Awaitable[Any]]]
+DependencyFactory = Callable[[Request], Union[Any, Awaitable[Any]]]
+
+
+async def _call(factory: Callable, *args: Any) -> Any:
+    result = factory(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+class Resources:
+    '''
+    Registry of shared resources and request-scoped dependencies
+    Resources with open()/close() methods (like genericapi.client.Client)
+    are opened when created and closed in reverse order
+        api.resources.add('users', lambda: Client('http://users'))
+        api.resources.dependency('user', lambda request: request.app.resources['users'].get(...))
+        ...
+        user = await request.app.resources.resolve(request, 'user')
+    '''
+    def __init__(self) -> None:
+        self._factories: Dict[str, ResourceFactory] = {}
+        self._dependencies: Dict[str, DependencyFactory] = {}
+        self._resources: Dict[str, Any] = {}
+
+    def add(self, name: str, factory: ResourceFactory) -> None:
+        '''Registers factory (sync or async) of a resource created when the API opens'''
+        if name in self._factories:
+            raise ValueError(f'resource {name!r} is already registered')
+        self._factories[name] = factory
+
+    def dependency(self, name: str, factory: DependencyFactory) -> None:
+        '''Registers factory (sync or async, taking the request) of a request-scoped dependency'''
+        if name in self._dependencies:
+            raise ValueError(f'dependency {name!r} is already registered')
+        self._dependencies[name] = factory
+
+    def __getitem__(self, name: str) -> Any:
+        try:
+            return self._resources[name]
+        except KeyError:
+            if name in self._factories:
+                raise RuntimeError(f'resource {name!r} is not open yet') from None
+            raise KeyError(f'no resource {name!r} registered') from None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._factories
+
+    async def resolve(self, request: Request, name: str) -> Any:
+        '''
+        Returns dependency name of request, creating it on first use
+        Concurrent resolutions within a request share one creation
+        '''
+        memo = request.get(REQUEST_KEY)
+        if memo is None:
+            memo = request[REQUEST_KEY] = {}
+        future = memo.get(name)
+        if future is None:
+            try:
+                factory = self._dependencies[name]
+            except KeyError:
+                raise KeyError(f'no dependency {name!r} registered') from None
+            future = memo[name] = asyncio.ensure_future(_call(factory, request))
+        return await asyncio.shield(future)
+
+    async def open(self) -> None:
+        '''Creates (and opens) every registered resource not created yet'''
+        for name, factory in self._factories.items():
+            if name in self._resources:
+                continue
+            resource = await _call(factory)
+            if hasattr(resource, 'open'):
+                await _call(resource.open)
+            self._resources[name] = resource
+
+    async def close(self) -> None:
+        '''Closes resources in reverse order of creation, failures are logged'''
+        while self._resources:
+            name, resource = self._resources.popitem()
+            if not hasattr(resource, 'close'):
+                continue
+            try:
+                await _call(resource.close)
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Closing resource %r failed', name)
@@ -1,11 +1,17 @@
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, TYPE_CHECKING, Union
 
-from aiohttp_cors import setup as setup_cors, ResourceOptions as CorsResourceOptions
-from aiohttp_cors.cors_config import CorsConfig
-from aiohttp.web_urldispatcher import ResourceRoute
+from aiohttp.web_urldispatcher import AbstractRoute, ResourceRoute
 from aiohttp.web import Application
 
 from ..types import AsyncRouteHandler, RawCorsConfig
+from .limiter import Priority
+from .cors import PrecompiledCors
+from .cache import DEFAULT_MAX_BYTES, HandlerCache
+from .validation import SwaggerValidators
+
+if TYPE_CHECKING:
+    from aiohttp_cors import ResourceOptions as CorsResourceOptions
+    from aiohttp_cors.cors_config import CorsConfig
 
 DEFAULT_CORS_CONFIG = {
     '*': dict(
@@ -17,27 +23,44 @@ DEFAULT_CORS_CONFIG = {
 }
 
 
-def compile_cors_config(cors_config: RawCorsConfig) -> Dict[str, CorsResourceOptions]:
+def compile_cors_config(cors_config: RawCorsConfig) -> Dict[str, 'CorsResourceOptions']:
     '''Compile cors config in a dictionary form to cors config accepted by cors.add'''
+    from aiohttp_cors import ResourceOptions as CorsResourceOptions  # pylint: disable=import-outside-toplevel
     return {cors_path: CorsResourceOptions(**cors_path_config)
             for cors_path, cors_path_config in cors_config.items()}
 
 
 class RouteManager:
-    '''Utility class helping with registering routes'''
-    def __init__(self, app: Application, *, root: str = '', cors: RawCorsConfig = DEFAULT_CORS_CONFIG) -> None:
+    '''
+    Utility class helping with registering routes
+    With precompiled_cors CORS is handled by a PrecompiledCors middleware
+    instead of aiohttp_cors
+    '''
+    def __init__(self,
+                 app: Application,
+                 *,
+                 root: str = '',
+                 cors: RawCorsConfig = DEFAULT_CORS_CONFIG,
+                 precompiled_cors: bool = False,
+                 cache_max_bytes: int = DEFAULT_MAX_BYTES) -> None:
         self.app = app
         self.root = root
-        self.cors = setup_cors(app, defaults=compile_cors_config(cors))
+        self.handler_cache = HandlerCache(cache_max_bytes)
+        # Set by API.setup_validation, routes added afterwards are validated
+        self.validators: Optional[SwaggerValidators] = None
+        self.cors: Union['CorsConfig', PrecompiledCors]
+        if precompiled_cors:
+            self.cors = PrecompiledCors(cors)
+            self.app.middlewares.insert(0, self.cors.middleware)
+        else:
+            from aiohttp_cors import setup as setup_cors  # pylint: disable=import-outside-toplevel
+            self.cors = setup_cors(app, defaults=compile_cors_config(cors))
+        self.priorities: Dict[AbstractRoute, Priority] = {}
 
-    def _get_cors_config(self,
-                         cors: Optional[RawCorsConfig],
-                         no_cors: bool) -> Optional[CorsConfig]:
-        if no_cors:
-            return None
-        if cors:
-            return compile_cors_config(cors)
-        return self.cors
+    def _add_cors(self, route: ResourceRoute, cors: Optional[RawCorsConfig]) -> ResourceRoute:
+        if isinstance(self.cors, PrecompiledCors):
+            return self.cors.add(route, cors)
+        return self.cors.add(route, compile_cors_config(cors) if cors else None)
 
     def add_route(self,
                   *,
@@ -46,23 +69,49 @@ class RouteManager:
                   handler: AsyncRouteHandler,
                   name: Optional[str] = None,
                   cors: Optional[RawCorsConfig] = None,
-                  no_cors: bool = False) -> ResourceRoute:
+                  no_cors: bool = False,
+                  priority: Optional[Union[Priority, str]] = None,
+                  cache: Optional[Union[float, Dict[str, Any]]] = None,
+                  validate: Optional[bool] = None) -> ResourceRoute:
         '''Add a route to application router
            Arguments:
-             method  -- route method (GET, POST, ...)
-             path    -- route path (/healthcheck etc)
-             handler -- route handler
-             name    -- route name
-             cors    -- pass cors config to override the default cors'''
+             method   -- route method (GET, POST, ...)
+             path     -- route path (/healthcheck etc)
+             handler  -- route handler
+             name     -- route name
+             cors     -- pass cors config to override the default cors
+             priority -- load shedding priority (low, normal, high), default normal
+             cache    -- cache GET/HEAD responses for that many seconds, or a dict
+                         of HandlerCache.wrap arguments (ttl, vary)
+             validate -- validate requests against the swagger spec (when validation is set up),
+                         None validates routes described in the spec, True requires it'''
+        if cache is not None:
+            options = cache if isinstance(cache, dict) else dict(ttl=cache)
+            handler = self.handler_cache.wrap(handler, **options)
+        if validate is not False:
+            handler = self._validated(method, path, handler, required=bool(validate))
         route = self.app.router.add_route(method=method,
                                           path=f'{self.root}{path}',
                                           handler=handler,
                                           name=name)
-        _cors = self._get_cors_config(cors, no_cors)
-        if _cors:
-            route = _cors.add(route)
+        if priority is not None:
+            self.priorities[route] = Priority.of(priority)
+        if not no_cors:
+            route = self._add_cors(route, cors)
         return route
 
+    def _validated(self, method: str, path: str, handler: AsyncRouteHandler, *, required: bool) -> AsyncRouteHandler:
+        validator = None
+        if self.validators is not None:
+            # Spec paths are relative to basePath, which may or may not include the root
+            validator = (self.validators.for_route(method, path)
+                         or self.validators.for_route(method, f'{self.root}{path}'))
+        if validator is None:
+            if required:
+                raise ValueError(f'no swagger spec to validate {method} {path} against')
+            return handler
+        return validator.wrap(handler)
+
     def add_routes(self, routes: List[dict]) -> None:
         '''
         Add batch of routes to application router
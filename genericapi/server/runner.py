@@ -0,0 +1,245 @@
+'''
+Serving an API from one or more worker processes
+Workers bind the same port with SO_REUSEPORT (or share a socket inherited from the
+supervisor where SO_REUSEPORT is unavailable) and are restarted when they die
+'''
+from typing import Any, Callable, Dict, Optional, Type, TYPE_CHECKING
+from dataclasses import dataclass
+import logging
+import asyncio
+import signal
+import socket
+import time
+import random
+import os
+
+from aiohttp.web import AppRunner, BaseRequest, SockSite, StreamResponse
+from aiohttp.web_log import AccessLogger
+
+if TYPE_CHECKING:
+    from multiprocessing.process import BaseProcess
+    from .application import API
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BACKLOG = 128
+SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+RESTART_DELAY = 1.
+MAX_RESTART_DELAY = 30.
+# Workers exiting sooner than that after being started count as failing to start
+STARTUP_GRACE = 10.
+MAX_STARTUP_FAILURES = 10
+STOP_TIMEOUT = 30.
+
+
+@dataclass
+class RunnerConfig:
+    '''
+    Server connection lifecycle settings
+      keepalive_timeout -- seconds an idle keep-alive connection is kept open
+      backlog           -- listen backlog of the server socket
+      reuse_port        -- bind with SO_REUSEPORT (workers share the port)
+      access_log        -- write access log lines at all
+      access_log_sample -- fraction of non-5xx requests logged (5xx are always logged)
+      shutdown_timeout  -- seconds in-flight requests are given to finish on shutdown
+    '''
+    keepalive_timeout: float = 75.
+    backlog: int = DEFAULT_BACKLOG
+    reuse_port: bool = True
+    access_log: bool = True
+    access_log_sample: float = 1.
+    shutdown_timeout: float = 60.
+
+    def runner_kwargs(self) -> Dict[str, Any]:
+        '''Keyword arguments of aiohttp.web.AppRunner'''
+        kwargs: Dict[str, Any] = dict(keepalive_timeout=self.keepalive_timeout,
+                                      shutdown_timeout=self.shutdown_timeout)
+        if not self.access_log:
+            kwargs['access_log'] = None
+        elif self.access_log_sample < 1:
+            kwargs['access_log_class'] = sampled_access_logger(self.access_log_sample)
+        return kwargs
+
+
+def sampled_access_logger(rate: float) -> Type[AccessLogger]:
+    '''Returns an AccessLogger class logging rate of requests (and every 5xx response)'''
+    class SampledAccessLogger(AccessLogger):
+        def log(self, request: BaseRequest, response: StreamResponse, time: float) -> None:  # pylint: disable=redefined-outer-name
+            if response.status >= 500 or random.random() < rate:
+                super().log(request, response, time)
+    return SampledAccessLogger
+
+
+def create_socket(host: str, port: int, *, reuse_port: bool = True, backlog: int = DEFAULT_BACKLOG) -> socket.socket:
+    '''Creates a listening TCP socket, with SO_REUSEPORT set if requested and supported'''
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port and hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def install_uvloop() -> bool:
+    '''Makes uvloop the event loop implementation if it's installed'''
+    try:
+        import uvloop  # pylint: disable=import-outside-toplevel
+    except ModuleNotFoundError:
+        log.warning('uvloop requested but not installed -- using the default event loop')
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def make_runner(app: 'API', config: Optional[RunnerConfig] = None) -> AppRunner:
+    '''Returns an AppRunner of app set up according to config (signals are left to the caller)'''
+    return AppRunner(app, handle_signals=False, **(config or RunnerConfig()).runner_kwargs())
+
+
+async def serve_app(app: 'API', sock: socket.socket, config: Optional[RunnerConfig] = None) -> None:
+    '''
+    Opens the app, serves it on sock until SIGTERM/SIGINT
+    and then shuts down gracefully: stops accepting connections, closes idle
+    keep-alive connections, waits up to config.shutdown_timeout for in-flight
+    requests and closes the app
+    The app is closed even if opening it fails partway
+    '''
+    config = config or RunnerConfig()
+    stopping = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signum in SHUTDOWN_SIGNALS:
+        loop.add_signal_handler(signum, stopping.set)
+    try:
+        await app.open()
+        runner = make_runner(app, config)
+        await runner.setup()
+        try:
+            await SockSite(runner, sock, backlog=config.backlog).start()
+            log.info('Worker %d serving %r on %s', os.getpid(), app.name, sock.getsockname())
+            await stopping.wait()
+            server = runner.server
+            log.info('Worker %d shutting down, draining %d connection(s)',
+                     os.getpid(), len(server.connections) if server is not None else 0)
+        finally:
+            await runner.cleanup()
+    finally:
+        await app.close()
+
+
+def run_worker(app: 'API',
+               *,
+               host: str,
+               port: int,
+               sock: Optional[socket.socket] = None,
+               use_uvloop: bool = False,
+               config: Optional[RunnerConfig] = None) -> None:
+    '''Worker process entry point'''
+    config = config or RunnerConfig()
+    for signum in SHUTDOWN_SIGNALS:
+        signal.signal(signum, signal.SIG_DFL)
+    if use_uvloop:
+        install_uvloop()
+    if sock is None:
+        sock = create_socket(host, port, reuse_port=config.reuse_port, backlog=config.backlog)
+    asyncio.run(serve_app(app, sock, config))
+
+
+class Supervisor:
+    '''
+    Runs workers processes forked from the current one, restarting any worker that exits
+    while the supervisor is running. On SIGTERM/SIGINT stops all workers gracefully,
+    killing those that don't finish within stop_timeout seconds
+    Workers dying within STARTUP_GRACE seconds are restarted with exponential backoff
+    (up to MAX_RESTART_DELAY), after max_startup_failures such deaths in a row the
+    supervisor gives up, stops the other workers and raises RuntimeError
+    '''
+    def __init__(self,
+                 target: Callable[[], None],
+                 workers: int,
+                 *,
+                 restart_delay: float = RESTART_DELAY,
+                 stop_timeout: float = STOP_TIMEOUT,
+                 max_startup_failures: int = MAX_STARTUP_FAILURES) -> None:
+        if workers < 1:
+            raise ValueError('at least one worker is required')
+        self.target = target
+        self.workers = workers
+        self.restart_delay = restart_delay
+        self.stop_timeout = stop_timeout
+        self.max_startup_failures = max_startup_failures
+        # Imported here so single process apps don't pay for multiprocessing
+        import multiprocessing  # pylint: disable=import-outside-toplevel
+        self._context = multiprocessing.get_context('fork')
+        self._processes: Dict[int, 'BaseProcess'] = {}
+        self._started: Dict[int, float] = {}
+        # Consecutive startup failures and scheduled restart time of each slot
+        self._failures: Dict[int, int] = {}
+        self._restarts: Dict[int, float] = {}
+        self._stopping = False
+
+    def _spawn(self, slot: int) -> None:
+        process = self._context.Process(target=self.target, name=f'worker-{slot}', daemon=False)
+        process.start()
+        self._processes[slot] = process
+        self._started[slot] = time.monotonic()
+        log.info('Started worker %d (pid %d)', slot, process.pid)
+
+    def _schedule_restart(self, slot: int, process: 'BaseProcess') -> None:
+        '''Schedules restart of slot, backing off while its worker keeps dying at startup'''
+        if time.monotonic() - self._started[slot] < STARTUP_GRACE:
+            self._failures[slot] = self._failures.get(slot, 0) + 1
+        else:
+            self._failures[slot] = 0
+        failures = self._failures[slot]
+        if failures >= self.max_startup_failures:
+            raise RuntimeError(f'worker {slot} failed to start {failures} times in a row '
+                               f'(last exit code {process.exitcode})')
+        delay = min(self.restart_delay * 2 ** failures, MAX_RESTART_DELAY)
+        log.error('Worker %d (pid %d) exited with code %s -- restarting in %.1fs',
+                  slot, process.pid, process.exitcode, delay)
+        self._restarts[slot] = time.monotonic() + delay
+
+    def _on_signal(self, signum: int, frame) -> None:
+        log.info('Received signal %d -- stopping workers', signum)
+        self._stopping = True
+
+    def run(self) -> None:
+        from multiprocessing.connection import wait as wait_for_sentinels  # pylint: disable=import-outside-toplevel
+        previous = {signum: signal.signal(signum, self._on_signal) for signum in SHUTDOWN_SIGNALS}
+        try:
+            for slot in range(self.workers):
+                self._spawn(slot)
+            while not self._stopping:
+                for slot, restart_at in list(self._restarts.items()):
+                    if restart_at <= time.monotonic():
+                        del self._restarts[slot]
+                        self._spawn(slot)
+                sentinels = {process.sentinel: slot for slot, process in self._processes.items()
+                             if slot not in self._restarts}
+                timeout = min([1.] + [restart_at - time.monotonic() for restart_at in self._restarts.values()])
+                for sentinel in wait_for_sentinels(list(sentinels), timeout=max(0., timeout)):
+                    slot = sentinels[sentinel]
+                    process = self._processes[slot]
+                    process.join()
+                    if self._stopping:
+                        break
+                    self._schedule_restart(slot, process)
+        finally:
+            self._stop()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def _stop(self) -> None:
+        for process in self._processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)  # type: ignore
+        deadline = time.monotonic() + self.stop_timeout
+        for process in self._processes.values():
+            process.join(max(0., deadline - time.monotonic()))
+            if process.is_alive():
+                log.warning('Worker %s did not stop in time -- killing', process.name)
+                process.kill()
+                process.join()
@@ -0,0 +1,72 @@
+'''Streaming responses for large collections'''
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Mapping, Optional, Union
+
+from aiohttp.abc import AbstractStreamWriter
+from aiohttp.web import BaseRequest, StreamResponse
+
+from ..json import get_codec, JSONCodec
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+Items = Union[AsyncIterable[Any], Iterable[Any]]
+
+
+async def _aiter(items: Items) -> AsyncIterator[Any]:
+    if hasattr(items, '__aiter__'):
+        async for item in items:  # type: ignore
+            yield item
+    else:
+        for item in items:  # type: ignore
+            yield item
+
+
+class HTTPStreamOk(StreamResponse):
+    '''
+    OK 200 streaming items of an (async) iterable
+    as a JSON array or, with ndjson=True, as newline delimited JSON
+    Items are serialized one by one and written in chunks of about chunk_size bytes,
+    each write waits for the transport to drain so memory use stays constant.
+    Return it from a handler (don't raise it); if the iterable fails mid-way
+    the connection is dropped, leaving the client with an incomplete document.
+    '''
+    def __init__(
+            self,
+            items: Items,
+            *,
+            ndjson: bool = False,
+            headers: Optional[Mapping[str, Any]] = None,
+            reason: Optional[str] = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            codec: Optional[JSONCodec] = None
+    ) -> None:
+        super().__init__(status=200, reason=reason, headers=headers)
+        self.content_type = 'application/x-ndjson' if ndjson else 'application/json'
+        self._items: Optional[Items] = items
+        self._ndjson = ndjson
+        self._chunk_size = chunk_size
+        self._codec = codec or get_codec()
+
+    async def prepare(self, request: BaseRequest) -> Optional[AbstractStreamWriter]:
+        writer = await super().prepare(request)
+        items, self._items = self._items, None
+        if items is not None and request.method != 'HEAD':
+            await self._write_items(items)
+        return writer
+
+    async def _write_items(self, items: Items) -> None:
+        dumps = self._codec.dumps
+        separator, opening, closing = (b'\n', b'', b'\n') if self._ndjson else (b',', b'[', b']')
+        buffer = bytearray(opening)
+        first = True
+        async for item in _aiter(items):
+            if not first:
+                buffer += separator
+            first = False
+            buffer += dumps(item)
+            if len(buffer) >= self._chunk_size:
+                await self.write(bytes(buffer))
+                buffer.clear()
+        if self._ndjson and first:
+            closing = b''
+        buffer += closing
+        if buffer:
+            await self.write(bytes(buffer))
@@ -0,0 +1,55 @@
+'''
+Swagger docs with the spec parsed on first request
+aiohttp_swagger (and yaml) are only imported once swagger is set up, and the
+spec file is parsed in an executor when the docs are first asked for
+'''
+from typing import Any, Mapping, Optional
+import asyncio
+import json
+
+from aiohttp.web import Application, json_response, Request, Response
+
+from ..singleflight import SingleFlight
+
+
+class LazySwaggerSpec:
+    '''Swagger spec loaded from a yaml file once, on first use (unless already parsed)'''
+    __slots__ = ('file', '_spec', '_flights')
+    def __init__(self, file: str, spec: Optional[Mapping[str, Any]] = None) -> None:
+        self.file = file
+        # Dumped like aiohttp_swagger does -- yaml specs may have non-string keys (status codes)
+        self._spec: Optional[str] = json.dumps(spec, default=str) if spec is not None else None
+        self._flights = SingleFlight()
+
+    def load(self) -> str:
+        '''Parses the spec file into swagger json (blocking)'''
+        from aiohttp_swagger.helpers import load_doc_from_yaml_file  # pylint: disable=import-outside-toplevel
+        return load_doc_from_yaml_file(self.file)
+
+    async def get(self) -> str:
+        if self._spec is None:
+            loop = asyncio.get_event_loop()
+            self._spec = await self._flights.do(None, lambda: loop.run_in_executor(None, self.load))
+        return self._spec
+
+    async def handler(self, request: Request) -> Response:
+        return json_response(text=await self.get())
+
+
+def setup_lazy_swagger(app: Application,
+                       *,
+                       swagger_url: str,
+                       swagger_file: str,
+                       spec: Optional[Mapping[str, Any]] = None) -> LazySwaggerSpec:
+    '''
+    Sets up aiohttp_swagger UI at swagger_url serving the spec from swagger_file lazily
+    or spec if it was parsed already
+    '''
+    from aiohttp_swagger import setup_swagger  # pylint: disable=import-outside-toplevel
+    lazy_spec = LazySwaggerSpec(swagger_file, spec)
+    # An empty spec is registered, its handler is replaced with the lazy one
+    setup_swagger(app,
+                  swagger_url=swagger_url,
+                  swagger_info={},
+                  swagger_def_decor=lambda _: lazy_spec.handler)
+    return lazy_spec
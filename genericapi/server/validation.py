@@ -0,0 +1,342 @@
+'''
+Request validation against the swagger spec
+Schemas (the JSON schema subset used by swagger 2.0) are compiled once into
+nested closures, so validating a request is a walk over plain python calls --
+the spec is never looked at again after startup
+'''
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+from functools import wraps
+import logging
+import re
+
+from aiohttp.web import HTTPException, Request, StreamResponse
+
+from ..exceptions.http import HTTPBadRequest
+from ..types import AsyncRouteHandler
+from ..json import get_codec
+
+log = logging.getLogger(__name__)
+
+Validator = Callable[[Any, str], None]
+TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+    'string': lambda value: isinstance(value, str),
+    'integer': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'boolean': lambda value: isinstance(value, bool),
+    'null': lambda value: value is None,
+}
+# Converters of query/path/header parameter strings
+PARAMETER_TYPES: Dict[str, Callable[[str], Any]] = {
+    'integer': int,
+    'number': float,
+    'boolean': lambda value: {'true': True, 'false': False}[value.lower()],
+    'string': str,
+}
+
+
+class ValidationError(ValueError):
+    '''Raised by compiled validators, message starts with the path of the invalid value'''
+
+
+def _fail(path: str, message: str) -> None:
+    raise ValidationError(f'{path or "$"}: {message}')
+
+
+class SchemaCompiler:
+    '''Compiles schemas resolving $refs against the spec they come from'''
+    def __init__(self, spec: Mapping[str, Any]) -> None:
+        self.spec = spec
+        self._refs: Dict[str, Validator] = {}
+
+    def _resolve(self, ref: str) -> Mapping[str, Any]:
+        if not ref.startswith('#/'):
+            raise ValueError(f'only local $refs are supported, got {ref!r}')
+        node: Any = self.spec
+        for part in ref[2:].split('/'):
+            node = node[part.replace('~1', '/').replace('~0', '~')]
+        return node
+
+    def compile(self, schema: Mapping[str, Any]) -> Validator:
+        '''Returns a function raising ValidationError for values not matching schema'''
+        if '$ref' in schema:
+            return self._compile_ref(schema['$ref'])
+        checks: List[Validator] = []
+        kind = schema.get('type')
+        if kind is not None:
+            checks.append(self._type_check(kind, schema.get('x-nullable', False)))
+        if 'enum' in schema:
+            options = list(schema['enum'])
+            checks.append(lambda value, path: value in options or _fail(path, f'must be one of {options}'))
+        for sub_schema in schema.get('allOf', ()):
+            checks.append(self.compile(sub_schema))
+        checks.extend(self._string_checks(schema))
+        checks.extend(self._number_checks(schema))
+        checks.extend(self._array_checks(schema))
+        checks.extend(self._object_checks(schema))
+        if not checks:
+            return lambda value, path: None
+        if len(checks) == 1:
+            return checks[0]
+
+        def _validate(value: Any, path: str) -> None:
+            for check in checks:
+                check(value, path)
+        return _validate
+
+    def _compile_ref(self, ref: str) -> Validator:
+        try:
+            return self._refs[ref]
+        except KeyError:
+            pass
+        # Placeholder first, so recursive schemas compile
+        compiled: List[Validator] = []
+        self._refs[ref] = lambda value, path: compiled[0](value, path)
+        compiled.append(self.compile(self._resolve(ref)))
+        self._refs[ref] = compiled[0]
+        return compiled[0]
+
+    @staticmethod
+    def _type_check(kind: Any, nullable: bool) -> Validator:
+        kinds = [kind] if isinstance(kind, str) else list(kind)
+        if nullable:
+            kinds.append('null')
+        tests = [TYPE_CHECKS[name] for name in kinds]
+        expected = ' or '.join(kinds)
+
+        def _check(value: Any, path: str) -> None:
+            for test in tests:
+                if test(value):
+                    return
+            _fail(path, f'expected {expected}, got {type(value).__name__}')
+        return _check
+
+    @staticmethod
+    def _string_checks(schema: Mapping[str, Any]) -> List[Validator]:
+        checks: List[Validator] = []
+        if 'minLength' in schema:
+            low = schema['minLength']
+            checks.append(lambda value, path: not isinstance(value, str) or len(value) >= low
+                          or _fail(path, f'shorter than {low}'))
+        if 'maxLength' in schema:
+            high = schema['maxLength']
+            checks.append(lambda value, path: not isinstance(value, str) or len(value) <= high
+                          or _fail(path, f'longer than {high}'))
+        if 'pattern' in schema:
+            pattern = re.compile(schema['pattern'])
+            checks.append(lambda value, path: not isinstance(value, str) or pattern.search(value)
+                          or _fail(path, f'does not match {pattern.pattern!r}'))
+        return checks
+
+    @staticmethod
+    def _number_checks(schema: Mapping[str, Any]) -> List[Validator]:
+        checks: List[Validator] = []
+        number = TYPE_CHECKS['number']
+        if 'minimum' in schema:
+            low = schema['minimum']
+            if schema.get('exclusiveMinimum'):
+                checks.append(lambda value, path: not number(value) or value > low
+                              or _fail(path, f'must be greater than {low}'))
+            else:
+                checks.append(lambda value, path: not number(value) or value >= low
+                              or _fail(path, f'must be at least {low}'))
+        if 'maximum' in schema:
+            high = schema['maximum']
+            if schema.get('exclusiveMaximum'):
+                checks.append(lambda value, path: not number(value) or value < high
+                              or _fail(path, f'must be less than {high}'))
+            else:
+                checks.append(lambda value, path: not number(value) or value <= high
+                              or _fail(path, f'must be at most {high}'))
+        return checks
+
+    def _array_checks(self, schema: Mapping[str, Any]) -> List[Validator]:
+        checks: List[Validator] = []
+        if 'minItems' in schema:
+            low = schema['minItems']
+            checks.append(lambda value, path: not isinstance(value, list) or len(value) >= low
+                          or _fail(path, f'fewer than {low} items'))
+        if 'maxItems' in schema:
+            high = schema['maxItems']
+            checks.append(lambda value, path: not isinstance(value, list) or len(value) <= high
+                          or _fail(path, f'more than {high} items'))
+        if isinstance(schema.get('items'), Mapping):
+            item = self.compile(schema['items'])
+
+            def _items(value: Any, path: str) -> None:
+                if isinstance(value, list):
+                    for index, element in enumerate(value):
+                        try:
+                            item(element, path)
+                        except ValidationError:
+                            # Paths are only formatted on failure, validating again to get it right
+                            item(element, f'{path}[{index}]')
+            checks.append(_items)
+        return checks
+
+    def _object_checks(self, schema: Mapping[str, Any]) -> List[Validator]:
+        checks: List[Validator] = []
+        required = list(schema.get('required', ()))
+        if required:
+            def _required(value: Any, path: str) -> None:
+                if isinstance(value, dict):
+                    for name in required:
+                        if name not in value:
+                            _fail(path, f'missing required property {name!r}')
+            checks.append(_required)
+        properties = {name: self.compile(sub_schema)
+                      for name, sub_schema in schema.get('properties', {}).items()}
+        additional = schema.get('additionalProperties', True)
+        extra: Optional[Validator] = None
+        if isinstance(additional, Mapping):
+            extra = self.compile(additional)
+        if properties or extra is not None or additional is False:
+            def _properties(value: Any, path: str) -> None:
+                if not isinstance(value, dict):
+                    return
+                for name, element in value.items():
+                    check = properties.get(name, extra)
+                    if check is not None:
+                        try:
+                            check(element, path)
+                        except ValidationError:
+                            check(element, f'{path}.{name}')
+                    elif additional is False and name not in properties:
+                        _fail(path, f'unexpected property {name!r}')
+            checks.append(_properties)
+        return checks
+
+
+class RouteValidator:
+    '''Compiled validation of a single swagger operation'''
+    __slots__ = ('parameters', 'body', 'body_required', 'response')
+    def __init__(self,
+                 parameters: List[Tuple[str, str, bool, Callable[[str], Any], Validator]],
+                 body: Optional[Validator],
+                 body_required: bool,
+                 response: Optional[Validator]) -> None:
+        self.parameters = parameters
+        self.body = body
+        self.body_required = body_required
+        self.response = response
+
+    async def validate_request(self, request: Request) -> None:
+        '''
+        Raises ValidationError if request doesn't match the operation
+        The parsed json body is stored under request['json']
+        '''
+        for location, name, required, convert, check in self.parameters:
+            if location == 'query':
+                raw = request.query.get(name)
+            elif location == 'path':
+                raw = request.match_info.get(name)
+            else:
+                raw = request.headers.get(name)
+            if raw is None:
+                if required:
+                    _fail(f'{location}.{name}', 'required parameter is missing')
+                continue
+            try:
+                value = convert(raw)
+            except (ValueError, KeyError):
+                _fail(f'{location}.{name}', f'invalid value {raw!r}')
+            check(value, f'{location}.{name}')
+        if self.body is not None:
+            if not request.can_read_body:
+                if self.body_required:
+                    _fail('body', 'request body is required')
+                return
+            try:
+                payload = await request.json(loads=get_codec().loads)
+            except ValueError:
+                _fail('body', 'request body is not valid json')
+            request['json'] = payload
+            self.body(payload, 'body')
+
+    def wrap(self, handler: AsyncRouteHandler) -> AsyncRouteHandler:
+        '''Returns handler validating requests first (and responses when compiled with them)'''
+        @wraps(handler)
+        async def _validated(request: Request) -> StreamResponse:
+            try:
+                await self.validate_request(request)
+            except ValidationError as exc:
+                raise HTTPBadRequest('request validation failed', blame='Client', errors=[str(exc)])
+            if self.response is None:
+                return await handler(request)
+            try:
+                response = await handler(request)
+            except HTTPException as exc:
+                self._check_response(request, exc)
+                raise
+            self._check_response(request, response)
+            return response
+        return _validated
+
+    def _check_response(self, request: Request, response: StreamResponse) -> None:
+        body = getattr(response, 'body', None)
+        if response.status != 200 or not isinstance(body, bytes):
+            return
+        try:
+            self.response(get_codec().loads(body), 'response')  # type: ignore
+        except (ValidationError, ValueError) as exc:
+            log.warning('Response of %s %s does not match the spec: %s', request.method, request.path, exc)
+
+
+class SwaggerValidators:
+    '''
+    RouteValidators compiled from a swagger 2.0 spec
+    for_route returns (and caches) the validator of an operation
+    '''
+    def __init__(self, spec: Mapping[str, Any], *, validate_responses: bool = False) -> None:
+        self.spec = spec
+        self.validate_responses = validate_responses
+        self._compiler = SchemaCompiler(spec)
+        self._routes: Dict[Tuple[str, str], Optional[RouteValidator]] = {}
+
+    def for_route(self, method: str, path: str) -> Optional[RouteValidator]:
+        '''Returns validator of method at path (as written in the spec), None if not in the spec'''
+        key = (method.lower(), path)
+        if key not in self._routes:
+            self._routes[key] = self._compile_operation(*key)
+        return self._routes[key]
+
+    def _compile_operation(self, method: str, path: str) -> Optional[RouteValidator]:
+        path_item = self.spec.get('paths', {}).get(path)
+        if not path_item or method not in path_item:
+            return None
+        operation = path_item[method]
+        parameters: List[Tuple[str, str, bool, Callable[[str], Any], Validator]] = []
+        body, body_required = None, False
+        # Operation parameters override path level ones of the same name and location
+        merged = {}
+        for parameter in [*path_item.get('parameters', ()), *operation.get('parameters', ())]:
+            if '$ref' in parameter:
+                parameter = self._compiler._resolve(parameter['$ref'])  # pylint: disable=protected-access
+            merged[parameter['in'], parameter['name']] = parameter
+        for (location, name), parameter in merged.items():
+            if location == 'body':
+                body = self._compiler.compile(parameter.get('schema', {}))
+                body_required = parameter.get('required', False)
+            elif location in ('query', 'path', 'header'):
+                parameters.append((location,
+                                   name,
+                                   parameter.get('required', location == 'path'),
+                                   PARAMETER_TYPES.get(parameter.get('type', 'string'), str),
+                                   self._compiler.compile({key: value for key, value in parameter.items()
+                                                           if key not in ('in', 'name', 'required',
+                                                                          'type', 'description')})))
+        response = None
+        responses = operation.get('responses', {})
+        # Unquoted status codes are parsed from yaml as ints
+        schema = (responses.get('200') or responses.get(200) or {}).get('schema')
+        if self.validate_responses and schema is not None:
+            response = self._compiler.compile(schema)
+        return RouteValidator(parameters, body, body_required, response)
+
+
+def load_spec(file: str) -> Dict[str, Any]:
+    '''Parses a yaml (or json) swagger file'''
+    import yaml  # pylint: disable=import-outside-toplevel
+    with open(file) as spec:
+        return yaml.safe_load(spec)
@@ -0,0 +1,62 @@
+'''Detection of code blocking the event loop'''
+from typing import Optional
+import traceback
+import threading
+import logging
+import asyncio
+import time
+import sys
+
+log = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    '''
+    Watches the event loop from a thread -- the loop bumps a heartbeat every
+    interval seconds and whenever it misses it for more than threshold seconds
+    the stack of the loop thread (pointing at the blocking handler) is logged
+    '''
+    def __init__(self, threshold: float, *, interval: Optional[float] = None) -> None:
+        self.threshold = threshold
+        self.interval = interval or threshold / 4
+        self.blocks = 0
+        self._heartbeat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_event_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._beat()
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _beat(self) -> None:
+        self._heartbeat = time.monotonic()
+        self._handle = self._loop.call_later(self.interval, self._beat)  # type: ignore
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or reported == heartbeat:
+                continue
+            # Reported once per block
+            reported = heartbeat
+            self.blocks += 1
+            frame = sys._current_frames().get(self._loop_thread)  # type: ignore  # pylint: disable=protected-access
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else '<unavailable>\n'
+            log.warning('Event loop blocked for more than %.3fs:\n%s', blocked, stack)
@@ -0,0 +1,36 @@
+'''Collapsing of concurrent identical calls into a single execution'''
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+import asyncio
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    '''
+    Makes sure that only one call per key is in flight at a time
+    Concurrent callers with the same key wait for and share the result
+    (or exception) of the call that is already running
+    '''
+    __slots__ = ('_calls',)
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        '''Runs func unless a call with the same key is in flight, in which case joins it'''
+        fut = self._calls.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(func())
+            self._calls[key] = fut
+            fut.add_done_callback(lambda done: self._forget(key, done))
+        # Shielded so that a cancelled waiter doesn't cancel the call for everyone else
+        return await asyncio.shield(fut)
+
+    def _forget(self, key: Hashable, fut: asyncio.Future) -> None:
+        if self._calls.get(key) is fut:
+            del self._calls[key]